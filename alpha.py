@@ -0,0 +1,84 @@
+import os
+
+import cv2
+import numpy as np
+from cv2.typing import MatLike
+
+ALPHA_DIR = "alpha"
+ALPHA_SAVE = False
+ALPHA_THRESHOLD = 150
+ALPHA_BAND = (16, 240)
+CASCADE_UNCERTAINTY = 0.02
+ALPHA_ERODE_SIZE = 5
+ALPHA_MATTING_PAD = 8
+ALPHA_MATTING_TILE = 256
+
+POST_PROCESS_LIST = [
+    "none",
+    "erode",
+    "matting",
+]
+
+
+def get_alpha_path(folder_path: str, model_name: str, image_name: str) -> str:
+    return os.path.join(folder_path, ALPHA_DIR, model_name, f"{image_name}.png")
+
+
+def load_alpha(path: str) -> MatLike | None:
+    if not os.path.exists(path):
+        return None
+    return cv2.imdecode(np.fromfile(path, np.uint8), cv2.IMREAD_GRAYSCALE)
+
+
+def save_alpha(path: str, alpha_map: MatLike) -> None:
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    result, n = cv2.imencode(".png", alpha_map, [cv2.IMWRITE_PNG_COMPRESSION, 1])
+    if not result:
+        raise ValueError("Failed to encode image")
+    with open(path, "wb") as f:
+        f.write(n.tobytes())
+
+
+def get_uncertainty(alpha_map: MatLike) -> float:
+    low, high = ALPHA_BAND
+    return float(np.count_nonzero((alpha_map > low) & (alpha_map < high))) / max(alpha_map.size, 1)
+
+
+def get_mask(alpha_map: MatLike, threshold: float, post_process: str = "none", image: MatLike | None = None) -> MatLike:
+    mask = np.where(alpha_map >= threshold, 255, 0).astype(np.uint8)
+    if post_process == "none":
+        return mask
+
+    # Post-processing only touches the uncertain band; confident pixels keep the thresholded value.
+    low, high = ALPHA_BAND
+    band = (alpha_map > low) & (alpha_map < high)
+    ys, xs = np.nonzero(band)
+    if len(ys) == 0:
+        return mask
+
+    if post_process == "erode":
+        kernel = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (ALPHA_ERODE_SIZE, ALPHA_ERODE_SIZE))
+        mask[band] = cv2.erode(mask, kernel)[band]
+    elif post_process == "matting" and image is not None:
+        from pymatting import estimate_alpha_cf
+
+        # Solved per tile that has band pixels; the band's bounding box is usually the whole outline of the subject.
+        h, w = mask.shape
+        pad, tile = ALPHA_MATTING_PAD, ALPHA_MATTING_TILE
+        for ty in range(ys.min() // tile * tile, ys.max() + 1, tile):
+            for tx in range(xs.min() // tile * tile, xs.max() + 1, tile):
+                core = band[ty : ty + tile, tx : tx + tile]
+                y1, y2 = max(ty - pad, 0), min(ty + tile + pad, h)
+                x1, x2 = max(tx - pad, 0), min(tx + tile + pad, w)
+                crop_band = band[y1:y2, x1:x2]
+                if not core.any():
+                    continue
+                trimap = np.where(alpha_map[y1:y2, x1:x2] >= high, 1.0, 0.0)
+                trimap[crop_band] = 0.5
+                if not (trimap == 1.0).any() or not (trimap == 0.0).any():
+                    continue  # Nothing to solve against; the thresholded values stay.
+                rgb = cv2.cvtColor(image[y1:y2, x1:x2], cv2.COLOR_BGRA2RGB) / 255.0
+                matte = estimate_alpha_cf(rgb, trimap)
+                matte = matte[ty - y1 : ty - y1 + core.shape[0], tx - x1 : tx - x1 + core.shape[1]]
+                mask[ty : ty + tile, tx : tx + tile][core] = np.clip(matte[core] * 255, 0, 255).astype(np.uint8)
+    return mask
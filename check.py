@@ -1,10 +1,22 @@
 import os
+from collections import Counter
 from tkinter import filedialog
 
 import cv2
 import numpy as np
+from PIL import Image
 from tqdm import tqdm
 
+from orientation import (
+    OrientationManifest,
+    apply_orientation,
+    get_exif_orientation,
+    get_oriented_size,
+    match_orientation,
+)
+from output import MASK_SUFFIX, OUTPUT_FORMAT_LIST, OUTPUT_SUFFIX_LIST, get_output_name
+from scan import IMAGE_EXTENSIONS, scan_files
+
 AUTO_FIX = False
 
 if __name__ == "__main__":
@@ -12,30 +24,22 @@ if __name__ == "__main__":
     if not folder_path:
         raise SystemExit("No folder selected")
 
-    original_files = [
-        f
-        for f in os.listdir(folder_path)
-        if os.path.isfile(os.path.join(folder_path, f))
-        if f.lower().endswith((".png", ".jpg", ".jpeg"))
-    ]
-
-    include_files = [
-        f
-        for f in os.listdir(os.path.join(folder_path, "include"))
-        if os.path.isfile(os.path.join(folder_path, "include", f))
-        if f.lower().endswith(".png")
-    ]
-
-    exclude_files = [
-        f
-        for f in os.listdir(os.path.join(folder_path, "exclude"))
-        if os.path.isfile(os.path.join(folder_path, "exclude", f))
-        if f.lower().endswith(".png")
-    ]
+    output_suffixes = tuple(OUTPUT_SUFFIX_LIST)
+    original_files = [name for _, name in scan_files(folder_path, IMAGE_EXTENSIONS)]
+    include_files = [name for _, name in scan_files(os.path.join(folder_path, "include"), output_suffixes)]
+    exclude_files = [name for _, name in scan_files(os.path.join(folder_path, "exclude"), output_suffixes)]
+
+    include_files_dict = {get_output_name(f): f for f in include_files}
+    exclude_files_dict = {get_output_name(f): f for f in exclude_files}
 
     original_files_set = set([os.path.splitext(f)[0] for f in original_files])
-    include_files_set = set([os.path.splitext(f)[0] for f in include_files])
-    exclude_files_set = set([os.path.splitext(f)[0] for f in exclude_files])
+    include_files_set = set(include_files_dict)
+    exclude_files_set = set(exclude_files_dict)
+
+    for files in [include_files, exclude_files]:
+        for name, count in Counter(get_output_name(f) for f in files).items():
+            if count > 1:
+                print(f"found multiple output formats: {name}")
 
     for files in (include_files_set | exclude_files_set) - original_files_set:
         print(f"not found original image: {files}")
@@ -46,29 +50,60 @@ if __name__ == "__main__":
     for files in include_files_set & exclude_files_set:
         print(f"found both include/exclude image: {files}")
 
+    orientation_manifest = OrientationManifest()
     for base_path in tqdm(original_files):
         filename = os.path.splitext(base_path)[0]
         if filename in include_files_set:
-            dir = "include"
+            path = os.path.join(folder_path, "include", include_files_dict[filename])
         elif filename in exclude_files_set:
-            dir = "exclude"
+            path = os.path.join(folder_path, "exclude", exclude_files_dict[filename])
         else:
             continue
 
-        path = os.path.join(folder_path, dir, f"{filename}.png")
+        with Image.open(path) as image:
+            size = image.size
+        original_path = os.path.join(folder_path, base_path)
+        with Image.open(original_path) as image:
+            raw_size = image.size
+        orientation = orientation_manifest.get_orientation(original_path)
+        base_size = get_oriented_size(raw_size, orientation)
 
-        cv_image = cv2.imdecode(np.fromfile(path, np.uint8), cv2.IMREAD_UNCHANGED)
-        cv_base_image = cv2.imdecode(np.fromfile(os.path.join(folder_path, base_path), np.uint8), cv2.IMREAD_UNCHANGED)
+        # Results written before EXIF orientation was applied on load are in the file's raw orientation.
+        is_raw = False
+        if orientation != (0, False) and orientation == get_exif_orientation(original_path):
+            if size != base_size:
+                is_raw = size == raw_size
+            elif not path.lower().endswith(MASK_SUFFIX):
+                # Half turns, mirrors and square images keep the size; the colours of the visible pixels tell.
+                flag = cv2.IMREAD_REDUCED_COLOR_4 | cv2.IMREAD_IGNORE_ORIENTATION
+                original = cv2.imdecode(np.fromfile(original_path, np.uint8), flag)
+                value = cv2.imdecode(np.fromfile(path, np.uint8), cv2.IMREAD_UNCHANGED)
+                if original is not None and value is not None:
+                    base = apply_orientation(original, orientation)
+                    is_raw = match_orientation(value, base, orientation) is not value
+        if is_raw:
+            tqdm.write(f"raw orientation: {base_path}")
 
-        if cv_image.shape[0] != cv_base_image.shape[0] or cv_image.shape[1] != cv_base_image.shape[1]:
+            if AUTO_FIX:
+                # Turn the result to match the original as shown; no manual turns have been made since.
+                value = cv2.imdecode(np.fromfile(path, np.uint8), cv2.IMREAD_UNCHANGED)
+                if value is None:
+                    raise ValueError("Failed to decode image")
+                value = apply_orientation(value, orientation)
+                params = next(p for s, p in OUTPUT_FORMAT_LIST.values() if path.lower().endswith(s))
+                result, n = cv2.imencode(os.path.splitext(path)[1], value, params)
+                if not result:
+                    raise ValueError("Failed to encode image")
+                with open(path, "wb") as f:
+                    f.write(n.tobytes())
+                tqdm.write(f"fixed: {base_path}")
+        elif size != base_size:
             tqdm.write(f"size mismatch: {base_path}")
 
             if AUTO_FIX:
-                if cv_image.shape[0] == cv_base_image.shape[1] and cv_image.shape[1] == cv_base_image.shape[0]:
-                    cv_image = cv2.rotate(cv_image, cv2.ROTATE_90_CLOCKWISE)
-                    result, n = cv2.imencode(".png", cv_image)
-                    with open(path, "wb") as f:
-                        f.write(n.tobytes())
+                if size == base_size[::-1]:
+                    # The result is the original turned a quarter counter-clockwise; only the sidecar changes.
+                    orientation_manifest.rotate(os.path.join(folder_path, base_path), 3)
                     tqdm.write(f"fixed: {base_path}")
                 else:
                     tqdm.write(f"skip: {base_path}")
@@ -0,0 +1,185 @@
+import io
+import json
+import os
+import sys
+import tarfile
+from concurrent.futures import ThreadPoolExecutor
+from tkinter import filedialog
+from typing import Dict, List, Tuple
+
+from tqdm import tqdm
+
+from orientation import OrientationManifest
+from output import MASK_SUFFIX, OUTPUT_SUFFIX_LIST, get_output_name
+
+EXPORT_DIR = "export"
+EXPORT_SHARD_SIZE = 1000
+EXPORT_EXCLUDE = True
+EXPORT_WORKERS = 8
+
+INDEX_NAME = "index.json"
+
+Sample = Tuple[str, List[Tuple[str, str]], Dict[str, bytes]]
+
+
+def list_samples(folder_paths: List[str], recursive: bool = False) -> Dict[str, Sample]:
+    """Samples are named by their path relative to the folders' common parent, so subfolders do not collide."""
+    from scan import IMAGE_EXTENSIONS, scan_files
+
+    root = os.path.commonpath([os.path.abspath(p) for p in folder_paths])
+    originals: Dict[str, Dict[str, str]] = {os.path.abspath(p): {} for p in folder_paths}
+    for folder_path in folder_paths:
+        for dir_path, f in scan_files(folder_path, IMAGE_EXTENSIONS, recursive):
+            originals.setdefault(os.path.abspath(dir_path), {})[os.path.splitext(f)[0]] = f
+    samples: Dict[str, Sample] = {}
+    orientation_manifest = OrientationManifest()
+    for dir_path, dir_originals in sorted(originals.items()):
+        for output in ["include", "exclude"] if EXPORT_EXCLUDE else ["include"]:
+            output_dir = os.path.join(dir_path, output)
+            for _, f in sorted(scan_files(output_dir, tuple(OUTPUT_SUFFIX_LIST))):
+                image_name = get_output_name(f)
+                if image_name is None:
+                    continue
+                name = os.path.relpath(os.path.join(dir_path, image_name), root).replace(os.sep, "/")
+                if name in samples:
+                    continue
+                suffix = f[len(image_name) :].lower()
+                sources = [(suffix, os.path.join(output_dir, f))]
+                extras: Dict[str, bytes] = {}
+                if suffix == MASK_SUFFIX:
+                    if image_name not in dir_originals:
+                        tqdm.write(f"not found original image: {name}")
+                        continue
+                    original_path = os.path.join(dir_path, dir_originals[image_name])
+                    sources.insert(0, (os.path.splitext(original_path)[1].lower(), original_path))
+                    # The mask is in the displayed orientation, so loaders must orient the raw original first.
+                    turns, mirror = orientation_manifest.get_orientation(original_path)
+                    extras[".orientation.json"] = json.dumps({"turns": turns, "mirror": mirror}).encode()
+                samples[name] = (output, sources, extras)
+    return samples
+
+
+def get_fingerprint(sample: Sample) -> List[list]:
+    fingerprint = []
+    for ext, path in sample[1]:
+        stat = os.stat(path)
+        fingerprint.append([ext, stat.st_mtime_ns, stat.st_size])
+    for ext, data in sample[2].items():
+        fingerprint.append([ext, data.decode()])
+    return fingerprint
+
+
+def load_index(export_dir: str) -> dict:
+    path = os.path.join(export_dir, INDEX_NAME)
+    if not os.path.exists(path):
+        return {"shards": [], "samples": {}}
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_index(export_dir: str, index: dict) -> None:
+    path = os.path.join(export_dir, INDEX_NAME)
+    with open(f"{path}.tmp", "w", encoding="utf-8") as f:
+        json.dump(index, f, ensure_ascii=False)
+    os.replace(f"{path}.tmp", path)
+
+
+def write_shard(export_dir: str, shard_name: str, samples: List[Tuple[str, Sample]]) -> Dict[str, dict]:
+    path = os.path.join(export_dir, shard_name)
+    entries: Dict[str, dict] = {}
+    with tarfile.open(f"{path}.tmp", "w", format=tarfile.PAX_FORMAT) as tar:
+        for name, (label, sources, extras) in samples:
+            members = []
+            for ext, source in sources:
+                with open(source, "rb") as f:
+                    members.append((ext, f.read()))
+            members.extend(extras.items())
+            members.append((".cls", label.encode()))
+            entries[name] = {"shard": shard_name, "members": {}}
+            for ext, data in members:
+                info = tarfile.TarInfo(f"{name}{ext}")
+                info.size = len(data)
+                tar.addfile(info, io.BytesIO(data))
+                # The data block ends at the padded end of the member that was just written.
+                padded = -(-info.size // tarfile.BLOCKSIZE) * tarfile.BLOCKSIZE
+                entries[name]["members"][ext] = [tar.offset - padded, info.size]
+    os.replace(f"{path}.tmp", path)
+    return entries
+
+
+def read_sample(export_dir: str, name: str, index: dict | None = None) -> Dict[str, bytes]:
+    entry = (index or load_index(export_dir))["samples"][name]
+    sample = {}
+    with open(os.path.join(export_dir, entry["shard"]), "rb") as f:
+        for ext, (offset, size) in entry["members"].items():
+            f.seek(offset)
+            sample[ext] = f.read(size)
+    return sample
+
+
+def export(folder_paths: List[str], export_dir: str, recursive: bool = False) -> None:
+    os.makedirs(export_dir, exist_ok=True)
+    index = load_index(export_dir)
+    samples = list_samples(folder_paths, recursive)
+
+    # Shards holding a removed or superseded copy are rewritten without it, so each shard only has current samples.
+    stale = set()
+    for name in set(index["samples"]) - set(samples):
+        stale.add(index["samples"].pop(name)["shard"])
+
+    changed = []
+    for name, sample in sorted(samples.items()):
+        fingerprint = get_fingerprint(sample)
+        entry = index["samples"].get(name)
+        if entry is None or entry["label"] != sample[0] or entry["source"] != fingerprint:
+            changed.append((name, sample, fingerprint))
+            if entry is not None:
+                stale.add(entry["shard"])
+    changed_names = set(name for name, _, _ in changed)
+    moved = [
+        (name, samples[name], entry["source"])
+        for name, entry in sorted(index["samples"].items())
+        if entry["shard"] in stale and name not in changed_names
+    ]
+
+    shard_numbers = [int(f[6:12]) for f in os.listdir(export_dir) if f.startswith("shard-") and f.endswith(".tar")]
+    start = max(shard_numbers, default=-1) + 1
+    written = changed + moved
+    chunks = [written[i : i + EXPORT_SHARD_SIZE] for i in range(0, len(written), EXPORT_SHARD_SIZE)]
+
+    with ThreadPoolExecutor(max_workers=EXPORT_WORKERS) as executor:
+        futures = [
+            executor.submit(write_shard, export_dir, f"shard-{start + i:06d}.tar", [(n, s) for n, s, _ in chunk])
+            for i, chunk in enumerate(chunks)
+        ]
+        for chunk, future in tqdm(zip(chunks, futures), total=len(chunks)):
+            entries = future.result()
+            for name, sample, fingerprint in chunk:
+                index["samples"][name] = {**entries[name], "label": sample[0], "source": fingerprint}
+
+    used = set(entry["shard"] for entry in index["samples"].values())
+    index["shards"] = sorted(used)
+    save_index(export_dir, index)
+    # Removed only after the index stops pointing at them.
+    for f in os.listdir(export_dir):
+        if f.startswith("shard-") and f.endswith(".tar") and f not in used:
+            os.remove(os.path.join(export_dir, f))
+    print(
+        f"exported: {len(changed)}, rewritten: {len(moved)}, total: {len(index['samples'])}, "
+        f"shards: {len(index['shards'])}"
+    )
+
+
+if __name__ == "__main__":
+    args = [arg for arg in sys.argv[1:] if arg != "--recursive"]
+    export_dir = None
+    if "--output" in args:
+        i = args.index("--output")
+        export_dir = args[i + 1]
+        del args[i : i + 2]
+    folder_paths = args or [filedialog.askdirectory(title="Select a folder")]
+    if not all(folder_paths):
+        raise SystemExit("No folder selected")
+    if export_dir is None:
+        export_dir = os.path.join(os.path.commonpath([os.path.abspath(p) for p in folder_paths]), EXPORT_DIR)
+    export(folder_paths, export_dir, "--recursive" in sys.argv)
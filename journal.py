@@ -0,0 +1,148 @@
+import hashlib
+import json
+import os
+import time
+from typing import Any, Dict, Tuple
+
+JOURNAL_NAME = ".journal.jsonl"
+JOURNAL_HASH_SIZE = 16
+JOURNAL_LOCK_EXPIRE = 10.0
+
+AUTO_SKIP_LIST = [
+    "none",
+    "updated",
+    "missing",
+]
+
+
+def get_file_hash(path: str) -> str:
+    digest = hashlib.blake2b(digest_size=JOURNAL_HASH_SIZE)
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class Journal:
+    """Append-only `.journal.jsonl` with the original's stat, hash and turns at the time each output was written.
+
+    Lease workers append to the same file, so reads pick up new lines from where the last read stopped and
+    writes take an O_EXCL lock file, like the orientation manifest."""
+
+    def __init__(self) -> None:
+        self.journals: Dict[str, Dict[str, Dict[str, Any]]] = {}
+        # (inode, bytes read, lines read) per folder; a new inode means the file was compacted.
+        self.positions: Dict[str, Tuple[int, int, int]] = {}
+
+    def load(self, folder_path: str) -> Dict[str, Dict[str, Any]]:
+        entries = self.read(folder_path)
+        if self.positions[folder_path][2] > len(entries) * 2:
+            self.compact(folder_path)
+        return entries
+
+    def read(self, folder_path: str) -> Dict[str, Dict[str, Any]]:
+        path = os.path.join(folder_path, JOURNAL_NAME)
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            self.journals[folder_path], self.positions[folder_path] = {}, (0, 0, 0)
+            return self.journals[folder_path]
+        inode, offset, lines = self.positions.get(folder_path, (0, 0, 0))
+        if folder_path not in self.journals or inode != stat.st_ino or stat.st_size < offset:
+            self.journals[folder_path], offset, lines = {}, 0, 0
+        elif stat.st_size == offset:
+            return self.journals[folder_path]
+
+        entries = self.journals[folder_path]
+        with open(path, "rb") as f:
+            f.seek(offset)
+            data = f.read()
+        # A line still being written is left for the next read.
+        end = data.rfind(b"\n") + 1
+        for line in data[:end].decode("utf-8").splitlines():
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError:
+                continue  # A line cut short by a crash.
+            entries[entry["name"]] = entry
+            lines += 1
+        self.positions[folder_path] = (stat.st_ino, offset + end, lines)
+        return entries
+
+    def lock(self, path: str) -> None:
+        start = time.monotonic()
+        while True:
+            try:
+                os.close(os.open(f"{path}.lock", os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+                return
+            except FileExistsError:
+                # A writer holds the lock for milliseconds; an old lock was left by a crashed process.
+                if time.monotonic() - start > JOURNAL_LOCK_EXPIRE:
+                    try:
+                        os.remove(f"{path}.lock")
+                    except FileNotFoundError:
+                        pass
+                    start = time.monotonic()
+                time.sleep(0.01)
+
+    def compact(self, folder_path: str) -> None:
+        path = os.path.join(folder_path, JOURNAL_NAME)
+        self.lock(path)
+        try:
+            # Re-read under the lock so lines appended by other processes since the last read are kept.
+            self.journals.pop(folder_path, None)
+            entries = self.read(folder_path)
+            with open(f"{path}.tmp", "w", encoding="utf-8") as f:
+                for entry in entries.values():
+                    f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+            os.replace(f"{path}.tmp", path)
+            stat = os.stat(path)
+            self.positions[folder_path] = (stat.st_ino, stat.st_size, len(entries))
+        finally:
+            os.remove(f"{path}.lock")
+
+    def append(self, folder_path: str, entry: Dict[str, Any]) -> None:
+        path = os.path.join(folder_path, JOURNAL_NAME)
+        self.lock(path)
+        try:
+            with open(path, "a+b") as f:
+                size = f.seek(0, os.SEEK_END)
+                if size:
+                    # Start on a new line if a crash left the last one unterminated.
+                    f.seek(size - 1)
+                    if f.read(1) != b"\n":
+                        f.write(b"\n")
+                f.write((json.dumps(entry, ensure_ascii=False) + "\n").encode("utf-8"))
+        finally:
+            os.remove(f"{path}.lock")
+        self.load(folder_path)
+
+    def record(self, image_path: str, output_path: str, turns: int) -> None:
+        folder_path = os.path.dirname(image_path)
+        stat = os.stat(image_path)
+        entry = {
+            "name": os.path.basename(image_path),
+            "output": os.path.relpath(output_path, folder_path),
+            "mtime": stat.st_mtime_ns,
+            "size": stat.st_size,
+            "hash": get_file_hash(image_path),
+            "turns": turns,
+        }
+        self.append(folder_path, entry)
+
+    def is_up_to_date(self, image_path: str, output_path: str, turns: int) -> bool:
+        folder_path = os.path.dirname(image_path)
+        entry = self.load(folder_path).get(os.path.basename(image_path))
+        stat = os.stat(image_path)
+        if entry is None:
+            # Written before the journal existed: trust it if it is newer than the original.
+            return os.stat(output_path).st_mtime_ns >= stat.st_mtime_ns
+        if entry["output"] != os.path.relpath(output_path, folder_path) or entry["turns"] != turns:
+            return False
+        if (entry["mtime"], entry["size"]) == (stat.st_mtime_ns, stat.st_size):
+            return True
+        # Touched or copied but possibly unchanged; only then pay for hashing.
+        if entry["size"] != stat.st_size or entry["hash"] != get_file_hash(image_path):
+            return False
+        self.append(folder_path, {**entry, "mtime": stat.st_mtime_ns})
+        return True
@@ -0,0 +1,211 @@
+import os
+import socket
+import sys
+import threading
+import time
+import uuid
+from tkinter import filedialog
+from typing import Dict
+
+LEASE_DIR = ".lease"
+LEASE_EXPIRE = 60.0
+LEASE_HEARTBEAT = 10.0
+
+
+class LeaseManager:
+    """Lease files in `<folder>/.lease`, created with O_EXCL and kept fresh by a heartbeat thread.
+    A lease whose mtime is older than `expire` seconds on the file server's clock can be reclaimed."""
+
+    def __init__(self, folder_path: str, expire: float = LEASE_EXPIRE, heartbeat: float = LEASE_HEARTBEAT) -> None:
+        self.folder_path = folder_path
+        self.lease_dir = os.path.join(folder_path, LEASE_DIR)
+        os.makedirs(self.lease_dir, exist_ok=True)
+        self.expire = expire
+        self.heartbeat = heartbeat
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.leases: Dict[str, str] = {}
+        self.clock_offset = 0.0
+        self.lock = threading.Lock()
+        self.stop_event = threading.Event()
+        self.thread = threading.Thread(target=self.heartbeat_loop, daemon=True)
+        self.thread.start()
+
+    def get_name(self, image_path: str) -> str:
+        # Images in subfolders share the root's lease dir, so the relative path is flattened into the name.
+        return os.path.relpath(image_path, self.folder_path).replace(os.sep, "%")
+
+    def get_lease_path(self, name: str) -> str:
+        return os.path.join(self.lease_dir, f"{name}.lease")
+
+    def claim(self, name: str) -> bool:
+        path = self.get_lease_path(name)
+        with self.lock:
+            if name in self.leases:
+                return True
+            if not self.create(path) and not (self.reclaim(path) and self.create(path)):
+                return False
+            self.leases[name] = path
+            self.update_clock_offset(path)
+            return True
+
+    def held(self, name: str) -> bool:
+        with self.lock:
+            return name in self.leases and self.read_owner(self.leases[name]) == self.owner
+
+    def release(self, name: str) -> None:
+        with self.lock:
+            path = self.leases.pop(name, None)
+            if path is not None and self.read_owner(path) == self.owner:
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+
+    def close(self) -> None:
+        self.stop_event.set()
+        for name in list(self.leases):
+            self.release(name)
+
+    def create(self, path: str) -> bool:
+        try:
+            fd = os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except FileExistsError:
+            return False
+        with os.fdopen(fd, "w") as f:
+            f.write(self.owner)
+        return True
+
+    def reclaim(self, path: str) -> bool:
+        if not self.expired(path):
+            return False
+        stale_path = f"{path}.{self.owner.replace(':', '_')}.stale"
+        try:
+            os.rename(path, stale_path)
+        except (FileNotFoundError, FileExistsError, PermissionError):
+            return False
+        # Another worker may have reclaimed and re-created the lease between the check and the rename.
+        if not self.expired(stale_path):
+            try:
+                os.link(stale_path, path)
+            except OSError:
+                pass
+            os.remove(stale_path)
+            return False
+        os.remove(stale_path)
+        return True
+
+    def expired(self, path: str) -> bool:
+        try:
+            mtime = os.stat(path).st_mtime
+        except FileNotFoundError:
+            return True
+        return time.time() + self.clock_offset - mtime > self.expire
+
+    def read_owner(self, path: str) -> str | None:
+        try:
+            with open(path, "r") as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def update_clock_offset(self, path: str) -> None:
+        try:
+            self.clock_offset = os.stat(path).st_mtime - time.time()
+        except FileNotFoundError:
+            pass
+
+    def heartbeat_loop(self) -> None:
+        while not self.stop_event.wait(self.heartbeat):
+            with self.lock:
+                for name, path in list(self.leases.items()):
+                    if self.read_owner(path) != self.owner:
+                        self.leases.pop(name)
+                        continue
+                    try:
+                        os.utime(path)
+                        self.update_clock_offset(path)
+                    except FileNotFoundError:
+                        self.leases.pop(name)
+
+
+if __name__ == "__main__":
+    import cv2
+    import numpy as np
+    from rembg import remove
+    from tqdm import tqdm
+
+    from alpha import ALPHA_SAVE, ALPHA_THRESHOLD, get_alpha_path, get_mask, load_alpha, save_alpha
+    from journal import Journal
+    from main import MODEL_NAME_LIST, PROVIDERS_LIST
+    from orientation import OrientationManifest, apply_orientation
+    from output import OUTPUT_FORMAT_LIST, compose_mask, encode_output, find_output
+    from scan import IMAGE_EXTENSIONS, scan_files
+    from server import InferenceClient
+    from variant import new_model_session
+
+    folder_path = sys.argv[1] if len(sys.argv) > 1 else filedialog.askdirectory(title="Select a folder")
+    if not folder_path:
+        raise SystemExit("No folder selected")
+    model_name = sys.argv[2] if len(sys.argv) > 2 else MODEL_NAME_LIST[0]
+    output_format = sys.argv[3] if len(sys.argv) > 3 else list(OUTPUT_FORMAT_LIST)[0]
+
+    image_files = [name for _, name in scan_files(folder_path, IMAGE_EXTENSIONS)]
+    os.makedirs(os.path.join(folder_path, "include"), exist_ok=True)
+
+    inference_client = InferenceClient()
+    session = None
+    lease_manager = LeaseManager(folder_path)
+    orientation_manifest = OrientationManifest()
+    journal = Journal()
+    pending = image_files
+    try:
+        while pending:
+            # Images leased by another worker are retried until they have a result, so a crashed worker's
+            # images are picked up once its leases expire instead of being left for the next run.
+            waiting = []
+            for image_file in tqdm(pending):
+                image_name = os.path.splitext(image_file)[0]
+                output_dirs = [os.path.join(folder_path, d) for d in ("include", "exclude")]
+                if any(find_output(d, image_name) for d in output_dirs):
+                    continue
+                if not lease_manager.claim(image_file):
+                    waiting.append(image_file)
+                    continue
+                if any(find_output(d, image_name) for d in output_dirs):
+                    lease_manager.release(image_file)
+                    continue
+                image_path = os.path.join(folder_path, image_file)
+                cv_image_base = cv2.imdecode(np.fromfile(image_path, np.uint8), cv2.IMREAD_UNCHANGED)
+                if cv_image_base.shape[2] == 3:
+                    cv_image_base = cv2.cvtColor(cv_image_base, cv2.COLOR_BGR2BGRA)
+                cv_image_base = apply_orientation(cv_image_base, orientation_manifest.get_orientation(image_path))
+                alpha_path = get_alpha_path(folder_path, model_name, image_name)
+                alpha_map = load_alpha(alpha_path) if ALPHA_SAVE else None
+                if alpha_map is None or alpha_map.shape != cv_image_base.shape[:2]:
+                    alpha_map = inference_client.remove(cv_image_base, model_name)
+                    if alpha_map is None:
+                        if session is None:
+                            image_paths = [os.path.join(folder_path, f) for f in image_files]
+                            session = new_model_session(model_name, PROVIDERS_LIST, image_paths)
+                        alpha_map = remove(cv_image_base, session=session, only_mask=True)  # type: ignore
+                    if ALPHA_SAVE:
+                        save_alpha(alpha_path, alpha_map)
+                cv_image = compose_mask(get_mask(alpha_map, ALPHA_THRESHOLD), cv_image_base)
+                if lease_manager.held(image_file):
+                    suffix, result, n = encode_output(cv_image, cv_image_base, output_format)
+                    if not result:
+                        raise ValueError("Failed to encode image")
+                    output_path = os.path.join(folder_path, "include", f"{image_name}{suffix}")
+                    with open(output_path, "wb") as f:
+                        f.write(n.tobytes())
+                    journal.record(image_path, output_path, orientation_manifest.get_turns(image_path))
+                else:
+                    tqdm.write(f"lease lost: {image_file}")
+                    waiting.append(image_file)
+                lease_manager.release(image_file)
+            pending = waiting
+            if pending:
+                tqdm.write(f"waiting for {len(pending)} images leased by other workers")
+                time.sleep(lease_manager.heartbeat)
+    finally:
+        lease_manager.close()
@@ -1,17 +1,52 @@
 import os
+import sys
+import time
 import tkinter as tk
 import traceback
+from concurrent.futures import Future, ThreadPoolExecutor
 from tkinter import DoubleVar, filedialog, messagebox
-from typing import List, Tuple
+from typing import Dict, List, Set, Tuple
 
 import cv2
 import numpy as np
 import onnxruntime as ort
 import pygame
 from cv2.typing import MatLike
-from rembg import new_session, remove
+from PIL import Image
+from rembg import remove
+from rembg.sessions.base import BaseSession
 from tqdm import tqdm
 
+from alpha import (
+    ALPHA_SAVE,
+    ALPHA_THRESHOLD,
+    CASCADE_UNCERTAINTY,
+    POST_PROCESS_LIST,
+    get_alpha_path,
+    get_mask,
+    get_uncertainty,
+    load_alpha,
+    save_alpha,
+)
+from journal import AUTO_SKIP_LIST, Journal
+from lease import LeaseManager
+from orientation import Orientation, OrientationManifest, apply_orientation, match_orientation
+from output import (
+    MASK_SUFFIX,
+    OUTPUT_FORMAT_LIST,
+    compose_mask,
+    decode_output,
+    encode_output,
+    find_output,
+    get_output_paths,
+)
+from phash import PHashIndex, is_aligned
+from scan import ImageList
+from segment import Segmentation
+from server import InferenceClient
+from thumbnail import ThumbnailBrowser
+from variant import get_model_name_list, new_model_session
+
 MODEL_NAME_LIST = [
     "u2net",
     "isnet-general-use",
@@ -31,6 +66,12 @@ MODEL_NAME_LIST = [
 ]
 
 
+# Fast model first; an image moves on to the next model only while its result stays uncertain.
+CASCADE_MODEL_LIST = [
+    "birefnet-general-lite",
+    "birefnet-general",
+]
+
 PROVIDERS_LIST = [
     "CUDAExecutionProvider",
     "CPUExecutionProvider",
@@ -39,6 +80,15 @@ PROVIDERS_LIST = [
     # "DirectMLExecutionProvider",
 ]
 
+PREVIEW_EXTENSIONS = (".jpg", ".jpeg")
+
+# IMREAD_REDUCED_* applies EXIF orientation unless ignored; like the full decode, orientation is applied afterwards.
+PREVIEW_REDUCED_LIST = [
+    (8, cv2.IMREAD_REDUCED_COLOR_8 | cv2.IMREAD_IGNORE_ORIENTATION, cv2.IMREAD_REDUCED_GRAYSCALE_8),
+    (4, cv2.IMREAD_REDUCED_COLOR_4 | cv2.IMREAD_IGNORE_ORIENTATION, cv2.IMREAD_REDUCED_GRAYSCALE_4),
+    (2, cv2.IMREAD_REDUCED_COLOR_2 | cv2.IMREAD_IGNORE_ORIENTATION, cv2.IMREAD_REDUCED_GRAYSCALE_2),
+]
+
 
 class Mode:
     View: int = 0
@@ -51,14 +101,37 @@ class Mode:
 
 
 class ImageViewer:
-    def __init__(self, root: tk.Tk, screen_size: Tuple[int, int]) -> None:
+    def __init__(
+        self,
+        root: tk.Tk,
+        screen_size: Tuple[int, int],
+        folder_paths: List[str] | None = None,
+        recursive: bool = False,
+    ) -> None:
         self.root = root
         self.screen_size = screen_size
-        self.rembg_session = new_session(model_name=MODEL_NAME_LIST[0], providers=PROVIDERS_LIST)
+        self.rembg_sessions: Dict[str, BaseSession] = {}
+        self.inference_client = InferenceClient()
+        self.local_model_names: Set[str] = set()
 
         self.cv_image: MatLike
         self.cv_image_base: MatLike
         self.selected_mask: MatLike
+        self.full_image_executor = ThreadPoolExecutor(max_workers=1)
+        self.full_image_future: Future[Tuple[MatLike, MatLike]] | None = None
+        self.decode_warning: str | None = None
+        self.segment_executor = ThreadPoolExecutor(max_workers=1)
+        self.segment_future: Future[Segmentation] | None = None
+        self.phash_executor = ThreadPoolExecutor(max_workers=1)
+        self.phash_future: Future[PHashIndex] | None = None
+        self.segment_enable = False
+        self.cascade_enable = False
+        self.cascade_counts = [0] * len(CASCADE_MODEL_LIST)
+        self.cascade_runs = [0] * len(CASCADE_MODEL_LIST)
+        self.cascade_times = [0.0] * len(CASCADE_MODEL_LIST)
+        self.cascade_inferred = 0
+        self.orientation_manifest = OrientationManifest()
+        self.journal = Journal()
         root.bind("<KeyPress>", self.key_press_event)
         root.bind("<KeyRelease>", self.key_release_event)
 
@@ -82,6 +155,13 @@ class ImageViewer:
         )
         self.next_button.pack(side=tk.LEFT, padx=5, pady=5)
 
+        self.browser_button = tk.Button(
+            self.top_frame,
+            text="Browser",
+            command=lambda: self.open_browser(),
+        )
+        self.browser_button.pack(side=tk.LEFT, padx=5, pady=5)
+
         self.reload_button = tk.Button(
             self.top_frame,
             text="Reload",
@@ -124,17 +204,66 @@ class ImageViewer:
         )
         self.auto_button.pack(side=tk.LEFT, padx=5, pady=5)
 
+        self.auto_skip_var = tk.StringVar()
+        self.auto_skip_var.set(AUTO_SKIP_LIST[0])
+        self.auto_skip_select = tk.OptionMenu(
+            self.top_frame,
+            self.auto_skip_var,
+            *AUTO_SKIP_LIST,
+        )
+        self.auto_skip_select.config(width=8, indicatoron=False)
+        self.auto_skip_select.pack(side=tk.LEFT, padx=5, pady=5)
+
+        self.share_toggle = tk.Button(
+            self.top_frame,
+            text="Share",
+            command=lambda: self.set_share(),
+        )
+        self.share_toggle.pack(side=tk.LEFT, padx=5, pady=5)
+
+        self.dedup_toggle = tk.Button(
+            self.top_frame,
+            text="Dedup",
+            command=lambda: self.set_dedup(),
+        )
+        self.dedup_toggle.pack(side=tk.LEFT, padx=5, pady=5)
+
+        self.cascade_toggle = tk.Button(
+            self.top_frame,
+            text="Cascade",
+            command=lambda: self.set_cascade(),
+        )
+        self.cascade_toggle.pack(side=tk.LEFT, padx=5, pady=5)
+
+        self.propagate_button = tk.Button(
+            self.top_frame,
+            text="Propagate",
+            command=lambda: self.propagate_image(),
+            state="disabled",
+        )
+        self.propagate_button.pack(side=tk.LEFT, padx=5, pady=5)
+
         self.model_name_var = tk.StringVar()
         self.model_name_var.set(MODEL_NAME_LIST[0])
         self.model_name_select = tk.OptionMenu(
             self.top_frame,
             self.model_name_var,
-            *MODEL_NAME_LIST,
+            *get_model_name_list(MODEL_NAME_LIST),
             command=lambda _: self.reload_model(),
         )
         self.model_name_select.config(width=15, indicatoron=False)
         self.model_name_select.pack(side=tk.LEFT, padx=5, pady=5)
 
+        self.output_format_var = tk.StringVar()
+        self.output_format_var.set(list(OUTPUT_FORMAT_LIST)[0])
+        self.output_format_select = tk.OptionMenu(
+            self.top_frame,
+            self.output_format_var,
+            *OUTPUT_FORMAT_LIST,
+        )
+        self.output_format_select.config(width=10, indicatoron=False)
+        self.output_format_select.pack(side=tk.LEFT, padx=5, pady=5)
+
         self.embed_pygame = tk.Frame(
             self.root,
             width=screen_size[0],
@@ -183,6 +312,13 @@ class ImageViewer:
         )
         self.undofill_button.pack(side=tk.LEFT, padx=5, pady=5)
 
+        self.segment_toggle = tk.Button(
+            self.button_frame,
+            text="Segment",
+            command=lambda: self.set_segment(),
+        )
+        self.segment_toggle.pack(side=tk.LEFT, padx=5, pady=5)
+
         self.rembg_button = tk.Button(
             self.button_frame,
             text="RemBg",
@@ -239,7 +375,35 @@ class ImageViewer:
         )
         self.fill_slider.pack(side=tk.LEFT, padx=5, pady=5)
 
-        self.image_files = self.select_folder()
+        self.alpha_threshold = DoubleVar()
+        self.alpha_threshold.set(ALPHA_THRESHOLD)
+        self.alpha_slider = tk.Scale(
+            self.button_frame,
+            orient="horizontal",
+            showvalue=False,
+            from_=1,
+            to=254,
+            variable=self.alpha_threshold,
+            background="white",
+            command=lambda _: self.update_alpha(dragging=True),
+        )
+        self.alpha_slider.bind("<ButtonRelease-1>", lambda _: self.update_alpha())
+        self.alpha_slider.bind("<KeyRelease>", lambda _: self.update_alpha())
+        self.alpha_slider.pack(side=tk.LEFT, padx=5, pady=5)
+
+        self.post_process_var = tk.StringVar()
+        self.post_process_var.set(POST_PROCESS_LIST[0])
+        self.post_process_select = tk.OptionMenu(
+            self.button_frame,
+            self.post_process_var,
+            *POST_PROCESS_LIST,
+            command=lambda _: self.update_alpha(),
+        )
+        self.post_process_select.config(width=8, indicatoron=False)
+        self.post_process_select.pack(side=tk.LEFT, padx=5, pady=5)
+
+        self.image_files = self.select_folder(folder_paths or [], recursive)
+        self.image_count = (0, False)
 
         root.focus_force()
         self.current_image = 0
@@ -262,24 +426,34 @@ class ImageViewer:
         self.mouse_pointer_size = 0
         self.mouse_border = False
         self.enable_shift = False
-        self.change_base = False
+        self.base_turns = 0
+        self.lease_manager: LeaseManager | None = None
+        self.phash_index: PHashIndex | None = None
+        self.browser: ThumbnailBrowser | None = None
         self.clock = pygame.time.Clock()
 
-    def select_folder(self) -> List[str]:
-        self.folder_path = filedialog.askdirectory(title="Select a folder")
-        if not self.folder_path:
+    def select_folder(self, folder_paths: List[str], recursive: bool) -> ImageList:
+        if not folder_paths:
+            folder_paths = [filedialog.askdirectory(title="Select a folder")]
+        if not folder_paths[0]:
             self.throw_error("No folder selected")
+        # The first folder holds the shared state (.lease, .phash.json) when several are given.
+        self.folder_path = folder_paths[0]
 
-        files = [
-            os.path.join(self.folder_path, f)
-            for f in os.listdir(self.folder_path)
-            if os.path.isfile(os.path.join(self.folder_path, f))
-            if f.lower().endswith((".png", ".jpg", ".jpeg"))
-        ]
+        # The viewer opens on the first image found; the rest of the list keeps filling in the background.
+        files = ImageList()
+        files.scan(folder_paths, recursive)
+        files.wait()
         if not files:
             self.throw_error("No image files in the folder")
         return files
 
+    def poll_image_files(self) -> None:
+        image_count = (len(self.image_files), self.image_files.done.is_set())
+        if self.image_count != image_count:
+            self.image_count = image_count
+            self.update_index_label()
+
     def throw_error(self, message: str) -> None:
         messagebox.showerror("Error", message)
         raise ValueError(message)
@@ -334,9 +508,8 @@ class ImageViewer:
         pos2 = self.get_image_pos(self.drag_start)
         trimed = self.trim(self.cv_image, pos1, pos2)
         if trimed.shape[0] > 0 and trimed.shape[1] > 0:
-            mask = remove(trimed, session=self.rembg_session)[:, :, 3] < 150  # type: ignore
-            trimed[mask] = np.array([0, 0, 0, 0])
-            self.cv_image = self.trim_back(trimed, pos1, pos2)
+            self.set_alpha(self.predict_alpha(trimed), Mode.RemBg, (pos1, pos2))
+            self.apply_alpha()
             self.render_image()
             self.render_scaled()
 
@@ -345,14 +518,126 @@ class ImageViewer:
         pos2 = self.get_image_pos(self.drag_start)
         trimed = self.trim(self.cv_image_base.copy(), pos1, pos2)
         if trimed.shape[0] > 0 and trimed.shape[1] > 0:
-            mask = remove(trimed, session=self.rembg_session)[:, :, 3] < 150  # type: ignore
-            trimed[mask] = np.array([0, 0, 0, 0])
-            mask = self.trim_back(trimed, pos1, pos2)[:, :, 3] == 255
-            self.cv_image[mask] = self.cv_image_base[mask]
+            self.set_alpha(self.predict_alpha(trimed), Mode.UndoBg, (pos1, pos2))
+            self.apply_alpha()
+            self.render_image()
+            self.render_scaled()
+
+    def predict_alpha(self, value: MatLike, model_name: str | None = None) -> MatLike:
+        model_name = model_name or self.model_name_var.get()
+        alpha_map = None
+        if model_name not in self.local_model_names:
+            try:
+                alpha_map = self.inference_client.remove(value, model_name)
+            except ValueError as e:
+                self.local_model_names.add(model_name)
+                messagebox.showwarning("Inference server", f"{e}\nRunning {model_name} in this process instead.")
+        if alpha_map is not None:
+            return alpha_map
+        # The session is only loaded when no server is running, so clients sharing one keep no model in memory.
+        if model_name not in self.rembg_sessions:
+            self.rembg_sessions[model_name] = new_model_session(model_name, PROVIDERS_LIST, self.image_files)
+        return remove(value, session=self.rembg_sessions[model_name], only_mask=True)  # type: ignore
+
+    def predict_cascade(self) -> MatLike:
+        if not CASCADE_MODEL_LIST:
+            raise ValueError("CASCADE_MODEL_LIST is empty")
+        inferred = False
+        last_stage = len(CASCADE_MODEL_LIST) - 1
+        for stage, model_name in enumerate(CASCADE_MODEL_LIST):
+            alpha_path = self.get_alpha_path(model_name)
+            alpha_map = load_alpha(alpha_path) if ALPHA_SAVE else None
+            if alpha_map is None or alpha_map.shape != self.cv_image_base.shape[:2]:
+                start = time.perf_counter()
+                alpha_map = self.predict_alpha(self.cv_image_base, model_name)
+                self.cascade_times[stage] += time.perf_counter() - start
+                self.cascade_runs[stage] += 1
+                inferred = True
+                if ALPHA_SAVE:
+                    save_alpha(alpha_path, alpha_map)
+            if stage == last_stage or get_uncertainty(alpha_map) <= CASCADE_UNCERTAINTY:
+                self.cascade_counts[stage] += 1
+                self.cascade_inferred += inferred
+                return alpha_map
+        raise AssertionError("unreachable")
+
+    def report_cascade(self) -> None:
+        for stage, model_name in enumerate(CASCADE_MODEL_LIST):
+            count, runs, seconds = self.cascade_counts[stage], self.cascade_runs[stage], self.cascade_times[stage]
+            print(f"cascade {model_name}: {count} accepted, {runs} runs, {seconds:.1f}s")
+        if CASCADE_MODEL_LIST and self.cascade_runs[-1]:
+            # Compared with running the last model on every image that needed inference, at its time per run.
+            # Images whose maps all came from ALPHA_SAVE cost nothing either way.
+            baseline = self.cascade_times[-1] / self.cascade_runs[-1] * self.cascade_inferred
+            print(f"cascade time saved: {baseline - sum(self.cascade_times):.1f}s")
+        else:
+            print("cascade time saved: unknown (the last model was never run)")
+
+    def get_alpha_path(self, model_name: str | None = None) -> str:
+        image_path = self.image_files[self.current_image % len(self.image_files)]
+        image_name = os.path.splitext(os.path.basename(image_path))[0]
+        return get_alpha_path(os.path.dirname(image_path), model_name or self.model_name_var.get(), image_name)
+
+    def set_alpha(
+        self,
+        alpha_map: MatLike | None,
+        mode: int = Mode.View,
+        box: Tuple[Tuple[int, int], Tuple[int, int]] | None = None,
+    ) -> None:
+        self.alpha_map = alpha_map
+        self.alpha_mode = mode
+        self.alpha_box = box
+        self.alpha_before = self.cv_image.copy() if box is not None else None
+
+    def apply_alpha(self, dragging: bool = False) -> None:
+        if self.alpha_map is None:
+            return
+        post_process = self.post_process_var.get()
+        if dragging and post_process == "matting":
+            # Matting takes seconds, so it only runs once the slider is released.
+            post_process = "none"
+        if self.alpha_box is None:
+            if self.alpha_map.shape != self.cv_image_base.shape[:2]:
+                return
+            mask = get_mask(self.alpha_map, self.alpha_threshold.get(), post_process, self.cv_image_base)
+            self.cv_image = compose_mask(mask, self.cv_image_base)
+            return
+
+        assert self.alpha_before is not None
+        pos1, pos2 = self.alpha_box
+        self.cv_image = self.alpha_before.copy()
+        if self.alpha_mode == Mode.RemBg:
+            trimed = self.trim(self.cv_image, pos1, pos2)
+            mask = get_mask(self.alpha_map, self.alpha_threshold.get(), post_process, trimed)
+            trimed[mask == 0] = np.array([0, 0, 0, 0])
+            trimed[:, :, 3] = np.minimum(trimed[:, :, 3], mask)
+            self.cv_image = self.trim_back(trimed, pos1, pos2)
+        elif self.alpha_mode == Mode.UndoBg:
+            trimed = self.trim(self.cv_image_base.copy(), pos1, pos2)
+            mask = get_mask(self.alpha_map, self.alpha_threshold.get(), post_process, trimed)
+            trimed[mask == 0] = np.array([0, 0, 0, 0])
+            trimed[:, :, 3] = np.minimum(trimed[:, :, 3], mask)
+            restore = self.trim_back(trimed, pos1, pos2)
+            keep = restore[:, :, 3] > 0
+            self.cv_image[keep] = restore[keep]
+
+    def update_alpha(self, dragging: bool = False) -> None:
+        self.ensure_full_image()
+        if self.alpha_map is None and ALPHA_SAVE:
+            self.set_alpha(load_alpha(self.get_alpha_path()))
+        if self.alpha_map is not None:
+            self.apply_alpha(dragging)
             self.render_image()
             self.render_scaled()
 
     def remove_flood_fill(self, pos: Tuple[int, int]) -> None:
+        segmentation = self.get_segmentation()
+        if segmentation is not None:
+            indices = segmentation.select(pos, self.fill_slider.get())
+            self.cv_image.reshape(-1, 4)[indices] = np.array([0, 0, 0, 0])
+            self.render_image()
+            self.render_scaled()
+            return
         value = cv2.cvtColor(self.cv_image.copy(), cv2.COLOR_BGRA2BGR)
         h, w = value.shape[:2]
         mask = np.zeros((h + 2, w + 2), np.uint8)
@@ -365,6 +650,13 @@ class ImageViewer:
         self.render_scaled()
 
     def undo_flood_fill(self, pos: Tuple[int, int]) -> None:
+        segmentation = self.get_segmentation()
+        if segmentation is not None:
+            indices = segmentation.select(pos, self.fill_slider.get())
+            self.cv_image.reshape(-1, 4)[indices] = self.cv_image_base.reshape(-1, 4)[indices]
+            self.render_image()
+            self.render_scaled()
+            return
         value = cv2.cvtColor(self.cv_image_base.copy(), cv2.COLOR_BGRA2BGR)
         h, w = value.shape[:2]
         mask = np.zeros((h + 2, w + 2), np.uint8)
@@ -378,6 +670,31 @@ class ImageViewer:
         self.render_image()
         self.render_scaled()
 
+    def set_segment(self) -> None:
+        self.segment_enable = not self.segment_enable
+        self.segment_toggle.config(relief=tk.SUNKEN if self.segment_enable else tk.RAISED)
+        self.start_segmentation()
+
+    def start_segmentation(self) -> None:
+        if self.segment_future is not None:
+            self.segment_future.cancel()
+            self.segment_future = None
+        if not self.segment_enable:
+            return
+        full_image_future = self.full_image_future
+        if full_image_future is None:
+            self.segment_future = self.segment_executor.submit(Segmentation, self.cv_image_base)
+        else:
+            self.segment_future = self.segment_executor.submit(
+                lambda: Segmentation(full_image_future.result()[0]),
+            )
+
+    def get_segmentation(self) -> Segmentation | None:
+        future = self.segment_future
+        if future is None or not future.done() or future.cancelled() or future.exception() is not None:
+            return None
+        return future.result()
+
     def add_border(self, value: MatLike) -> MatLike:
         x, y, w, h = cv2.boundingRect(cv2.cvtColor(value, cv2.COLOR_BGRA2GRAY))
         if self.scale <= 1:
@@ -416,9 +733,26 @@ class ImageViewer:
         self.update_index_label()
 
     def update_index_label(self) -> None:
-        self.index_label.config(text=f"Index: {self.current_image + 1}/{len(self.image_files)}")
+        scanning = "" if self.image_files.done.is_set() else "+"
+        self.index_label.config(text=f"Index: {self.current_image + 1}/{len(self.image_files)}{scanning}")
+        if self.browser is not None and self.browser.winfo_exists():
+            self.browser.set_current(self.current_image % len(self.image_files))
+
+    def open_browser(self) -> None:
+        if self.browser is not None and self.browser.winfo_exists():
+            self.browser.lift()
+            return
+        self.browser = ThumbnailBrowser(self.root, self.image_files, self.orientation_manifest, self.jump_image)
+        self.browser.set_current(self.current_image % len(self.image_files))
+
+    def jump_image(self, index: int) -> None:
+        self.current_image = index
+        self.move_image(self.current_image)
+        self.update_index_label()
 
     def clear_image(self) -> None:
+        self.ensure_full_image()
+        self.set_alpha(None)
         self.cv_image = self.cv_image_base.copy()
         self.render_image()
         self.render_scaled()
@@ -434,6 +768,8 @@ class ImageViewer:
         self.exclude_button.config(text="Exclude*")
 
     def rotate_image(self) -> None:
+        self.ensure_full_image()
+        self.set_alpha(None)
         if self.cv_image.shape[0] == self.cv_image.shape[1]:
             self.cv_image = cv2.rotate(self.cv_image, cv2.ROTATE_90_CLOCKWISE)
         else:
@@ -442,10 +778,13 @@ class ImageViewer:
         self.render_scaled()
 
     def rotate_base_image(self) -> None:
+        self.ensure_full_image()
+        self.set_alpha(None)
         self.cv_image = cv2.rotate(self.cv_image, cv2.ROTATE_90_CLOCKWISE)
         self.cv_image_base = cv2.rotate(self.cv_image_base, cv2.ROTATE_90_CLOCKWISE)
+        self.start_segmentation()
         self.fit_to_screen()
-        self.change_base = True
+        self.base_turns += 1
 
     def set_background_view(self) -> None:
         if self.background_view:
@@ -457,21 +796,135 @@ class ImageViewer:
         self.render_image()
         self.render_scaled()
 
+    def set_share(self) -> None:
+        if self.lease_manager is not None:
+            self.lease_manager.close()
+            self.lease_manager = None
+            self.share_toggle.config(relief=tk.RAISED)
+        else:
+            self.lease_manager = LeaseManager(self.folder_path)
+            self.share_toggle.config(relief=tk.SUNKEN)
+
+    def claim_image(self) -> bool:
+        image_path = self.image_files[self.current_image % len(self.image_files)]
+        if self.is_skipped(image_path):
+            return False
+        if self.lease_manager is None:
+            return True
+        name = self.lease_manager.get_name(image_path)
+        if self.has_output(image_path) or not self.lease_manager.claim(name):
+            return False
+        if self.has_output(image_path):
+            self.lease_manager.release(name)
+            return False
+        return True
+
+    def is_leased(self, image_path: str) -> bool:
+        """Whether `claim_image` turned the image down only because another process holds its lease."""
+        return self.lease_manager is not None and not self.is_skipped(image_path) and not self.has_output(image_path)
+
+    def is_skipped(self, image_path: str) -> bool:
+        skip = self.auto_skip_var.get()
+        if skip == "none":
+            return False
+        image_name = os.path.splitext(os.path.basename(image_path))[0]
+        for output in ["include", "exclude"]:
+            output_path = find_output(os.path.join(os.path.dirname(image_path), output), image_name)
+            if output_path:
+                turns = self.orientation_manifest.get_turns(image_path)
+                return skip == "missing" or self.journal.is_up_to_date(image_path, output_path, turns)
+        return False
+
+    def has_output(self, image_path: str) -> bool:
+        image_name = os.path.splitext(os.path.basename(image_path))[0]
+        for output in ["include", "exclude"]:
+            if find_output(os.path.join(os.path.dirname(image_path), output), image_name):
+                return True
+        return False
+
+    def held_image(self) -> bool:
+        if self.lease_manager is None:
+            return True
+        image_path = self.image_files[self.current_image % len(self.image_files)]
+        return self.lease_manager.held(self.lease_manager.get_name(image_path))
+
+    def release_image(self) -> None:
+        if self.lease_manager is None:
+            return
+        image_path = self.image_files[self.current_image % len(self.image_files)]
+        self.lease_manager.release(self.lease_manager.get_name(image_path))
+
     def auto(self) -> None:
         if self.auto_button.cget("relief") == tk.RAISED:
             self.fps_label.config(text="Processing Auto", width=15)
             self.auto_button.config(relief=tk.SUNKEN)
-            for _ in tqdm(self.image_files[self.current_image :]):
-                mask = remove(self.cv_image_base, session=self.rembg_session)[:, :, 3] >= 150  # type: ignore
-                self.cv_image = np.zeros_like(self.cv_image)
-                self.cv_image[mask] = self.cv_image_base[mask]
-                self.render_image()
-                self.render_scaled()
-                self.next_frame()
-                self.include_image()
+            self.cascade_counts = [0] * len(CASCADE_MODEL_LIST)
+            self.cascade_runs = [0] * len(CASCADE_MODEL_LIST)
+            self.cascade_times = [0.0] * len(CASCADE_MODEL_LIST)
+            self.cascade_inferred = 0
+            # Skipping is cheap, so with a skip mode Auto goes round the whole folder and resumes wherever it stopped.
+            count = len(self.image_files) - self.current_image
+            if self.auto_skip_var.get() != "none":
+                count = len(self.image_files)
+            loaded = self.current_image
+            indexes = [(self.current_image + i) % len(self.image_files) for i in range(count)]
+            while indexes:
+                # Images leased by another process are retried until they have a result, so a crashed
+                # process's images are picked up once its leases expire.
+                waiting: List[int] = []
+                for index in tqdm(indexes):
+                    self.current_image = index
+                    self.update_index_label()
+                    if self.claim_image():
+                        if loaded != self.current_image:
+                            # Auto needs the full image right away, so a preview would only be decoded twice.
+                            self.move_image(self.current_image, preview=False)
+                            loaded = self.current_image
+                        self.ensure_full_image()
+                        self.poll_phash_index()
+                        cv_image = self.get_duplicate_image()
+                        if cv_image is not None:
+                            self.cv_image = cv_image
+                            self.set_alpha(None)
+                        elif self.cascade_enable:
+                            self.set_alpha(self.predict_cascade())
+                            self.apply_alpha()
+                        else:
+                            alpha_map = load_alpha(self.get_alpha_path()) if ALPHA_SAVE else None
+                            if alpha_map is None or alpha_map.shape != self.cv_image_base.shape[:2]:
+                                alpha_map = self.predict_alpha(self.cv_image_base)
+                                if ALPHA_SAVE:
+                                    save_alpha(self.get_alpha_path(), alpha_map)
+                            self.set_alpha(alpha_map)
+                            self.apply_alpha()
+                        self.render_image()
+                        self.render_scaled()
+                        self.next_frame()
+                        if self.held_image():
+                            self.include_image()
+                        else:
+                            waiting.append(index)
+                        self.release_image()
+                    else:
+                        if self.is_leased(self.image_files[index]):
+                            waiting.append(index)
+                        self.next_frame()
+                    if self.auto_button.cget("relief") == tk.RAISED:
+                        break
+                indexes = waiting
+                if indexes and self.lease_manager is not None:
+                    self.fps_label.config(text=f"Waiting {len(indexes)}", width=15)
+                    deadline = time.monotonic() + self.lease_manager.heartbeat
+                    while time.monotonic() < deadline and self.auto_button.cget("relief") == tk.SUNKEN:
+                        self.next_frame()
+                        self.clock.tick(30)
+                    self.fps_label.config(text="Processing Auto", width=15)
                 if self.auto_button.cget("relief") == tk.RAISED:
                     break
-                self.next_image()
+            if loaded != self.current_image:
+                self.move_image(self.current_image)
+            if self.cascade_enable:
+                self.report_cascade()
             self.fps_label.config(text="FPS: 0", width=8)
             self.auto_button.config(relief=tk.RAISED)
         else:
@@ -479,36 +932,153 @@ class ImageViewer:
             self.auto_button.config(relief=tk.RAISED)
 
     def reload_model(self) -> None:
-        del self.rembg_session
-        self.rembg_session = new_session(model_name=self.model_name_var.get(), providers=PROVIDERS_LIST)
+        self.rembg_sessions = {}
+
+    def set_cascade(self) -> None:
+        self.cascade_enable = not self.cascade_enable
+        self.cascade_toggle.config(relief=tk.SUNKEN if self.cascade_enable else tk.RAISED)
+
+    def set_dedup(self) -> None:
+        if self.phash_index is not None or self.phash_future is not None:
+            # A build in progress cannot be stopped; its result is dropped by poll_phash_index.
+            self.phash_index = None
+            self.phash_future = None
+            self.dedup_toggle.config(text="Dedup", relief=tk.RAISED)
+            self.propagate_button.config(state="disabled")
+        else:
+            # Hashing a large folder takes minutes, so it is built in the background like segmentation.
+            self.dedup_toggle.config(text="Hashing", relief=tk.SUNKEN)
+            folder_path, image_files = self.folder_path, self.image_files
+
+            def build() -> PHashIndex:
+                phash_index = PHashIndex(folder_path)
+                phash_index.update(image_files)
+                return phash_index
+
+            self.phash_future = self.phash_executor.submit(build)
+
+    def poll_phash_index(self) -> None:
+        future = self.phash_future
+        if future is None or not future.done():
+            return
+        self.phash_future = None
+        self.dedup_toggle.config(text="Dedup")
+        if future.exception() is not None:
+            self.dedup_toggle.config(relief=tk.RAISED)
+            messagebox.showerror("Dedup", str(future.exception()))
+            return
+        self.phash_index = future.result()
+        self.propagate_button.config(state="normal")
+
+    def transform_mask(self, mask: MatLike, rotation: int, size: Tuple[int, int]) -> MatLike:
+        mask = np.ascontiguousarray(np.rot90(mask, -rotation))
+        if (mask.shape[1], mask.shape[0]) != size:
+            mask = cv2.resize(mask, size, interpolation=cv2.INTER_NEAREST)
+        return mask
+
+    def get_duplicate_image(self) -> MatLike | None:
+        if self.phash_index is None:
+            return None
+        image_path = self.image_files[self.current_image % len(self.image_files)]
+        image_name = os.path.relpath(image_path, self.folder_path)
+        if image_name not in self.phash_index.entries:
+            return None
+        image_size = self.phash_index.get_size(image_name)
+        size = (self.cv_image_base.shape[1], self.cv_image_base.shape[0])
+        for duplicate_name, rotation in self.phash_index.find_duplicates(image_name):
+            duplicate_path = os.path.normpath(os.path.join(self.folder_path, duplicate_name))
+            include_dir = os.path.join(os.path.dirname(duplicate_path), "include")
+            output_path = find_output(include_dir, os.path.splitext(os.path.basename(duplicate_path))[0])
+            if output_path is None or not is_aligned(image_size, self.phash_index.get_size(duplicate_name), rotation):
+                continue
+            oriented_rotation = self.get_oriented_rotation(image_path, duplicate_path, rotation)
+            if oriented_rotation is None:
+                continue
+            orientation = self.orientation_manifest.get_orientation(duplicate_path)
+            _, cv_image = self.decode_image(duplicate_path, output_path, orientation)
+            if self.decode_warning is not None:
+                self.decode_warning = None
+                continue
+            mask = self.transform_mask(cv_image[:, :, 3], -oriented_rotation, size)
+            return compose_mask(mask, self.cv_image_base)
+        return None
+
+    def get_oriented_rotation(self, image_path: str, duplicate_path: str, rotation: int) -> int | None:
+        turns, mirror = self.orientation_manifest.get_orientation(image_path)
+        duplicate_turns, duplicate_mirror = self.orientation_manifest.get_orientation(duplicate_path)
+        if mirror or duplicate_mirror:
+            return None
+        return (rotation + duplicate_turns - turns) % 4
+
+    def propagate_image(self) -> None:
+        self.ensure_full_image()
+        if self.phash_index is None:
+            return
+        image_path = self.image_files[self.current_image % len(self.image_files)]
+        image_name = os.path.relpath(image_path, self.folder_path)
+        duplicates = [
+            (os.path.normpath(os.path.join(self.folder_path, name)), rotation)
+            for name, rotation in self.phash_index.find_duplicates(image_name)
+            if is_aligned(self.phash_index.get_size(image_name), self.phash_index.get_size(name), rotation)
+        ]
+        duplicates = [(path, rotation) for path, rotation in duplicates if not self.has_output(path)]
+        if not duplicates:
+            messagebox.showinfo("Propagate", "No unprocessed duplicates found")
+            return
+        names = "\n".join(os.path.basename(path) for path, _ in duplicates)
+        if not messagebox.askyesno("Propagate", f"Include these duplicates with the same mask?\n{names}"):
+            return
+        for duplicate_path, rotation in tqdm(duplicates):
+            oriented_rotation = self.get_oriented_rotation(image_path, duplicate_path, rotation)
+            if oriented_rotation is None:
+                continue
+            orientation = self.orientation_manifest.get_orientation(duplicate_path)
+            cv_image_base, _ = self.decode_image(duplicate_path, None, orientation)
+            size = (cv_image_base.shape[1], cv_image_base.shape[0])
+            mask = self.transform_mask(self.cv_image[:, :, 3], oriented_rotation, size)
+            cv_image = compose_mask(mask, cv_image_base)
+            output_path = self.write_output(duplicate_path, "include", ["exclude"], cv_image, cv_image_base)
+            self.journal.record(duplicate_path, output_path, self.orientation_manifest.get_turns(duplicate_path))
 
     def image_dump(self, output: str, remove_path: list[str]) -> None:
+        self.ensure_full_image()
         image_path = self.image_files[self.current_image % len(self.image_files)]
+        output_path = self.write_output(image_path, output, remove_path, self.cv_image, self.cv_image_base)
+
+        if self.base_turns:
+            self.orientation_manifest.rotate(image_path, self.base_turns)
+            self.base_turns = 0
+        self.journal.record(image_path, output_path, self.orientation_manifest.get_turns(image_path))
+
+    def write_output(
+        self,
+        image_path: str,
+        output: str,
+        remove_path: list[str],
+        cv_image: MatLike,
+        cv_image_base: MatLike,
+    ) -> str:
         image_name, image_ext = os.path.splitext(os.path.basename(image_path))
 
         output_dir = os.path.join(os.path.dirname(image_path), output)
         os.makedirs(output_dir, exist_ok=True)
 
-        result, n = cv2.imencode(".png", self.cv_image)
+        suffix, result, n = encode_output(cv_image, cv_image_base, self.output_format_var.get())
         if not result:
             self.throw_error("Failed to encode image")
 
-        with open(os.path.join(output_dir, f"{image_name}.png"), "wb") as f:
+        output_path = os.path.join(output_dir, f"{image_name}{suffix}")
+        with open(output_path, "wb") as f:
             f.write(n.tobytes())
 
+        remove_images = [path for path in get_output_paths(output_dir, image_name) if path != output_path]
         for re in remove_path:
             remove_dir = os.path.join(os.path.dirname(image_path), re)
-            remove_image = os.path.join(remove_dir, f"{image_name}.png")
+            remove_images.extend(get_output_paths(remove_dir, image_name))
+        for remove_image in remove_images:
             if os.path.exists(remove_image):
                 os.remove(remove_image)
-
-        if self.change_base:
-            result, n = cv2.imencode(os.path.splitext(image_path)[1], self.cv_image_base)
-            if not result:
-                self.throw_error("Failed to encode image")
-
-            with open(image_path, "wb") as f:
-                f.write(n.tobytes())
+        return output_path
 
     def render_box(self, pos1: Tuple[int, int], pos2: Tuple[int, int]) -> None:
         surface = pygame.Surface((abs(pos1[0] - pos2[0]), abs(pos1[1] - pos2[1])))
@@ -539,6 +1109,9 @@ class ImageViewer:
     def pygame_loop(self) -> None:
         try:
             while True:
+                self.poll_full_image()
+                self.poll_phash_index()
+                self.poll_image_files()
                 self.handle_events()
                 self.next_frame()
                 self.fps_label.config(text=f"FPS: {self.clock.get_fps():.2f}")
@@ -562,13 +1135,14 @@ class ImageViewer:
         self.root.update_idletasks()
         self.root.update()
 
-    def load_image(self, image_path: str) -> None:
+    def load_image(self, image_path: str, preview: bool = True) -> None:
         image_name, image_ext = os.path.splitext(os.path.basename(image_path))
         self.root.title(f"Background Eraser - {image_name}{image_ext}")
-        self.change_base = False
-        self.cv_image_base = cv2.imdecode(np.fromfile(image_path, np.uint8), cv2.IMREAD_UNCHANGED)
-        if self.cv_image_base.shape[2] == 3:
-            self.cv_image_base = cv2.cvtColor(self.cv_image_base, cv2.COLOR_BGR2BGRA)
+        self.base_turns = 0
+        self.set_alpha(None)
+        if self.full_image_future is not None:
+            self.full_image_future.cancel()
+            self.full_image_future = None
         files = [
             (self.include_button, "Include"),
             (self.exclude_button, "Exclude"),
@@ -576,23 +1150,102 @@ class ImageViewer:
         for button, output in files:
             button.config(text=output)
 
+        output_path = None
         for button, output in files:
-            path = os.path.join(os.path.dirname(image_path), output.lower(), f"{image_name}.png")
-            if os.path.exists(path):
-                self.cv_image = cv2.imdecode(np.fromfile(path, np.uint8), cv2.IMREAD_UNCHANGED)
-                if self.cv_image.shape[2] == 3:
-                    self.cv_image = cv2.cvtColor(self.cv_image, cv2.COLOR_BGR2BGRA)
+            output_path = find_output(os.path.join(os.path.dirname(image_path), output.lower()), image_name)
+            if output_path is not None:
                 button.config(text=f"{output}*")
                 break
+
+        orientation = self.orientation_manifest.get_orientation(image_path)
+        flags = self.get_preview_flags(image_path) if preview else None
+        if flags is None:
+            self.cv_image_base, self.cv_image = self.decode_image(image_path, output_path, orientation)
+            self.show_decode_warning()
         else:
+            self.cv_image_base = cv2.imdecode(np.fromfile(image_path, np.uint8), flags[0])
+            self.cv_image_base = apply_orientation(cv2.cvtColor(self.cv_image_base, cv2.COLOR_BGR2BGRA), orientation)
             self.cv_image = self.cv_image_base.copy()
+            # Masks decode reduced like the original. Colour results have no reduced decode, so the original is
+            # shown until the full image decode brings the result in.
+            if output_path is not None and output_path.lower().endswith(MASK_SUFFIX):
+                self.cv_image = self.decode_preview_mask(output_path, flags[1], orientation)
+            self.full_image_future = self.full_image_executor.submit(
+                self.decode_image, image_path, output_path, orientation
+            )
+        self.start_segmentation()
+
+    def decode_image(
+        self,
+        image_path: str,
+        output_path: str | None,
+        orientation: Orientation,
+    ) -> Tuple[MatLike, MatLike]:
+        cv_image_base = cv2.imdecode(np.fromfile(image_path, np.uint8), cv2.IMREAD_UNCHANGED)
+        if cv_image_base.shape[2] == 3:
+            cv_image_base = cv2.cvtColor(cv_image_base, cv2.COLOR_BGR2BGRA)
+        cv_image_base = apply_orientation(cv_image_base, orientation)
+        if output_path is None:
+            return cv_image_base, cv_image_base.copy()
+        try:
+            return cv_image_base, decode_output(output_path, cv_image_base, orientation)
+        except ValueError as e:
+            # Shown by the caller on the Tk thread; this may run on the full image executor.
+            self.decode_warning = f"{os.path.basename(output_path)}: {e}"
+            return cv_image_base, cv_image_base.copy()
+
+    def show_decode_warning(self) -> None:
+        if self.decode_warning is not None:
+            messagebox.showwarning("Result", f"{self.decode_warning}\nShowing the original instead.")
+            self.decode_warning = None
+
+    def decode_preview_mask(self, output_path: str, gray_flag: int, orientation: Orientation) -> MatLike:
+        mask = cv2.imdecode(np.fromfile(output_path, np.uint8), gray_flag)
+        mask = match_orientation(mask, self.cv_image_base, orientation)
+        if mask is None:
+            return self.cv_image_base.copy()
+        h, w = self.cv_image_base.shape[:2]
+        if mask.shape[:2] != (h, w):
+            mask = cv2.resize(mask, (w, h), interpolation=cv2.INTER_NEAREST)
+        return compose_mask(mask, self.cv_image_base)
+
+    def get_preview_flags(self, image_path: str) -> Tuple[int, int] | None:
+        if not image_path.lower().endswith(PREVIEW_EXTENSIONS):
+            return None
+        with Image.open(image_path) as image:
+            img_w, img_h = image.size
+        screen_w, screen_h = self.screen_size
+        for factor, color_flag, gray_flag in PREVIEW_REDUCED_LIST:
+            if img_w // factor >= screen_w or img_h // factor >= screen_h:
+                return color_flag, gray_flag
+        return None
+
+    def ensure_full_image(self) -> None:
+        if self.full_image_future is None:
+            return
+        cv_image_base, cv_image = self.full_image_future.result()
+        self.full_image_future = None
+        ratio = cv_image_base.shape[1] / self.cv_image_base.shape[1]
+        self.cv_image_base = cv_image_base
+        self.cv_image = cv_image
+        self.fit_scale /= ratio
+        self.scale /= ratio
+        self.image_rect.width = int(self.cv_image.shape[1] * self.scale)
+        self.image_rect.height = int(self.cv_image.shape[0] * self.scale)
+        self.render_image()
+        self.render_scaled()
+        self.show_decode_warning()
+
+    def poll_full_image(self) -> None:
+        if self.full_image_future is not None and self.full_image_future.done():
+            self.ensure_full_image()
 
-    def move_image(self, index: int):
-        self.load_image(self.image_files[index % len(self.image_files)])
+    def move_image(self, index: int, preview: bool = True):
+        self.load_image(self.image_files[index % len(self.image_files)], preview)
         self.fit_to_screen()
 
     def reload_image(self):
-        self.load_image(self.image_files[self.current_image % len(self.image_files)])
+        self.load_image(self.image_files[self.current_image % len(self.image_files)], preview=False)
         self.render_image()
         self.render_scaled()
 
@@ -681,6 +1334,9 @@ class ImageViewer:
 
     def handle_events(self):
         for event in pygame.event.get():
+            if event.type == pygame.MOUSEBUTTONDOWN and event.button == 1 and self.mode != Mode.View:
+                self.ensure_full_image()
+                self.set_alpha(None)
             if event.type == pygame.QUIT:
                 pygame.quit()
                 self.root.quit()
@@ -792,6 +1448,7 @@ class ImageViewer:
 
 if __name__ == "__main__":
     print(ort.get_available_providers())
+    folder_paths = [arg for arg in sys.argv[1:] if arg != "--recursive"]
     root = tk.Tk()
-    viewer = ImageViewer(root, screen_size=(800, 600))
+    viewer = ImageViewer(root, screen_size=(800, 600), folder_paths=folder_paths, recursive="--recursive" in sys.argv)
     viewer.pygame_loop()
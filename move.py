@@ -5,6 +5,10 @@ from tkinter import filedialog
 from watchdog.events import FileSystemEventHandler
 from watchdog.observers import Observer
 
+from orientation import OrientationManifest
+from output import find_output
+from scan import IMAGE_EXTENSIONS, SCAN_SKIP_DIRS
+
 
 class MultiFolderSelectApp:
     def __init__(self, root, folder_paths):
@@ -14,7 +18,7 @@ class MultiFolderSelectApp:
         self.log_text = tk.Text(self.root, width=50, height=10)
         self.log_text.pack()
 
-        event_handler = FolderEventHandler(self)
+        event_handler = FolderEventHandler(self, folder_paths)
         observer = Observer()
         observer.schedule(event_handler, folder_paths, recursive=True)
         observer.start()
@@ -25,8 +29,9 @@ class MultiFolderSelectApp:
 
 
 class FolderEventHandler(FileSystemEventHandler):
-    def __init__(self, app: MultiFolderSelectApp):
+    def __init__(self, app: MultiFolderSelectApp, folder_path: str):
         self.app = app
+        self.folder_path = folder_path
         self.log = False
         self.basename_from: dict[str, str] = {}
 
@@ -37,9 +42,19 @@ class FolderEventHandler(FileSystemEventHandler):
     def error(self, message: str):
         self.app.show_log(message)
 
+    def is_original(self, event) -> bool:
+        # Lease files, the manifest, the journal, the phash index, alpha maps and export shards are written
+        # under the watched folder too; only originals are moved between folders.
+        if event.is_directory or not event.src_path.lower().endswith(IMAGE_EXTENSIONS):
+            return False
+        parts = os.path.relpath(os.path.dirname(event.src_path), self.folder_path).split(os.sep)
+        return not any(part != "." and (part.startswith(".") or part in SCAN_SKIP_DIRS) for part in parts)
+
     def on_created(self, event):
         super().on_created(event)
         assert isinstance(event.src_path, str)
+        if not self.is_original(event):
+            return
         dir = os.path.dirname(event.src_path)
         if not (dir.endswith("include") or dir.endswith("exclude")):
             assert isinstance(event.src_path, str)
@@ -48,6 +63,7 @@ class FolderEventHandler(FileSystemEventHandler):
             from_dir = self.basename_from.get(f"{filename}{ext}")
             if from_dir:
                 self.move(from_dir, dir, filename)
+                self.move_orientation(from_dir, dir, f"{filename}{ext}")
                 self.basename_from.pop(f"{filename}{ext}")
             else:
                 self.error(f"Error: {filename} is unknown")
@@ -55,6 +71,8 @@ class FolderEventHandler(FileSystemEventHandler):
     def on_deleted(self, event):
         super().on_deleted(event)
         assert isinstance(event.src_path, str)
+        if not self.is_original(event):
+            return
         dir = os.path.dirname(event.src_path)
         if not (dir.endswith("include") or dir.endswith("exclude")):
             filename, ext = os.path.splitext(os.path.basename(event.src_path))
@@ -65,21 +83,22 @@ class FolderEventHandler(FileSystemEventHandler):
                 self.basename_from[f"{filename}{ext}"] = dir
 
     def move(self, from_dir: str, to_dir: str, filename: str):
-        include_path = os.path.join(from_dir, "include", f"{filename}.png")
-        new_include_path = os.path.join(to_dir, "include", f"{filename}.png")
-
-        exclude_path = os.path.join(from_dir, "exclude", f"{filename}.png")
-        new_exclude_path = os.path.join(to_dir, "exclude", f"{filename}.png")
-
-        if os.path.exists(include_path):
-            os.rename(include_path, new_include_path)
-            self.info(f"Move: {filename} from {from_dir} to {to_dir}")
-        elif os.path.exists(exclude_path):
-            os.rename(exclude_path, new_exclude_path)
-            self.info(f"Move: {filename} from {from_dir} to {to_dir}")
+        for output in ["include", "exclude"]:
+            path = find_output(os.path.join(from_dir, output), filename)
+            if path:
+                os.rename(path, os.path.join(to_dir, output, os.path.basename(path)))
+                self.info(f"Move: {filename} from {from_dir} to {to_dir}")
+                break
         else:
             self.error(f"Error: {filename} is unknown")
 
+    def move_orientation(self, from_dir: str, to_dir: str, basename: str):
+        orientation_manifest = OrientationManifest()
+        turns = orientation_manifest.get_turns(os.path.join(from_dir, basename))
+        if turns:
+            orientation_manifest.set_turns(os.path.join(to_dir, basename), turns)
+            orientation_manifest.set_turns(os.path.join(from_dir, basename), 0)
+
 
 if __name__ == "__main__":
     folder_paths = filedialog.askdirectory(mustexist=True, title="Select folders")
@@ -0,0 +1,156 @@
+import json
+import os
+import time
+from typing import Callable, Dict, Tuple
+
+import cv2
+import numpy as np
+from cv2.typing import MatLike
+from PIL import Image
+
+ORIENTATION_MANIFEST = ".orientation.json"
+ORIENTATION_LOCK_EXPIRE = 10.0
+
+# EXIF orientation -> (clockwise quarter turns, mirrored horizontally before turning)
+EXIF_ORIENTATION_LIST = {
+    1: (0, False),
+    2: (0, True),
+    3: (2, False),
+    4: (2, True),
+    5: (3, True),
+    6: (1, False),
+    7: (1, True),
+    8: (3, False),
+}
+
+ROTATE_CODE_LIST = {
+    1: cv2.ROTATE_90_CLOCKWISE,
+    2: cv2.ROTATE_180,
+    3: cv2.ROTATE_90_COUNTERCLOCKWISE,
+}
+
+Orientation = Tuple[int, bool]
+
+
+def get_exif_orientation(image_path: str) -> Orientation:
+    with Image.open(image_path) as image:
+        return EXIF_ORIENTATION_LIST.get(image.getexif().get(0x0112, 1), (0, False))
+
+
+def apply_orientation(value: MatLike, orientation: Orientation) -> MatLike:
+    turns, mirror = orientation
+    if mirror:
+        value = cv2.flip(value, 1)
+    if turns % 4:
+        value = cv2.rotate(value, ROTATE_CODE_LIST[turns % 4])
+    return value
+
+
+def match_orientation(value: MatLike | None, cv_image_base: MatLike, orientation: Orientation) -> MatLike | None:
+    """Returns a result in the displayed orientation of `cv_image_base`, or None if it fits in no orientation
+    or could not be decoded.
+
+    Results written before orientation was applied at decode time are in the file's raw orientation. Sizes tell
+    the two apart for quarter turns; otherwise the colours of the visible pixels decide, and masks are kept."""
+    if value is None:
+        return None
+    candidates = [value]
+    if orientation != (0, False):
+        candidates.append(apply_orientation(value, orientation))
+    h, w = cv_image_base.shape[:2]
+    # Aspect rather than exact size, so reduced previews can be matched too.
+    candidates = [c for c in candidates if abs(c.shape[1] * h - w * c.shape[0]) <= 0.01 * c.shape[0] * h]
+    if len(candidates) < 2 or value.ndim == 2:
+        return candidates[0] if candidates else None
+
+    base = cv2.resize(cv_image_base, (32, 32), interpolation=cv2.INTER_AREA).astype(np.float32)
+
+    def get_error(candidate: MatLike) -> float:
+        small = cv2.resize(candidate, (32, 32), interpolation=cv2.INTER_AREA).astype(np.float32)
+        visible = small[:, :, 3] > 0 if small.shape[2] == 4 else np.ones((32, 32), bool)
+        return float(np.abs(small[:, :, :3] - base[:, :, :3])[visible].mean()) if visible.any() else 0.0
+
+    return min(candidates, key=get_error)
+
+
+def get_oriented_size(size: Tuple[int, int], orientation: Orientation) -> Tuple[int, int]:
+    return size if orientation[0] % 2 == 0 else (size[1], size[0])
+
+
+class OrientationManifest:
+    """Per-folder `.orientation.json` with extra clockwise quarter turns applied on top of EXIF at decode time.
+    Reads are refreshed when the file's mtime changes; writes re-read and merge under an O_EXCL lock file so
+    processes sharing the folder do not overwrite each other's entries."""
+
+    def __init__(self) -> None:
+        self.manifests: Dict[str, Tuple[Tuple[int, int], Dict[str, int]]] = {}
+
+    def get_stamp(self, path: str) -> Tuple[int, int]:
+        # Size as well as mtime, for shares whose mtime resolution is coarser than two quick writes.
+        try:
+            stat = os.stat(path)
+            return stat.st_mtime_ns, stat.st_size
+        except FileNotFoundError:
+            return 0, 0
+
+    def read(self, path: str) -> Tuple[Tuple[int, int], Dict[str, int]]:
+        try:
+            stamp = self.get_stamp(path)
+            with open(path, "r", encoding="utf-8") as f:
+                return stamp, json.load(f)
+        except FileNotFoundError:
+            return (0, 0), {}
+
+    def load(self, folder_path: str) -> Dict[str, int]:
+        path = os.path.join(folder_path, ORIENTATION_MANIFEST)
+        if folder_path not in self.manifests or self.manifests[folder_path][0] != self.get_stamp(path):
+            self.manifests[folder_path] = self.read(path)
+        return self.manifests[folder_path][1]
+
+    def lock(self, path: str) -> None:
+        start = time.monotonic()
+        while True:
+            try:
+                os.close(os.open(f"{path}.lock", os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+                return
+            except FileExistsError:
+                # A writer holds the lock for milliseconds; an old lock was left by a crashed process.
+                if time.monotonic() - start > ORIENTATION_LOCK_EXPIRE:
+                    try:
+                        os.remove(f"{path}.lock")
+                    except FileNotFoundError:
+                        pass
+                    start = time.monotonic()
+                time.sleep(0.01)
+
+    def update(self, image_path: str, get_turns: Callable[[int], int]) -> None:
+        folder_path = os.path.dirname(image_path)
+        name = os.path.basename(image_path)
+        path = os.path.join(folder_path, ORIENTATION_MANIFEST)
+        self.lock(path)
+        try:
+            _, manifest = self.read(path)
+            turns = get_turns(manifest.get(name, 0)) % 4
+            if turns:
+                manifest[name] = turns
+            else:
+                manifest.pop(name, None)
+            with open(f"{path}.tmp", "w", encoding="utf-8") as f:
+                json.dump(manifest, f, ensure_ascii=False, indent=2)
+            os.replace(f"{path}.tmp", path)
+            self.manifests[folder_path] = (self.get_stamp(path), manifest)
+        finally:
+            os.remove(f"{path}.lock")
+
+    def get_turns(self, image_path: str) -> int:
+        return self.load(os.path.dirname(image_path)).get(os.path.basename(image_path), 0)
+
+    def set_turns(self, image_path: str, turns: int) -> None:
+        self.update(image_path, lambda _: turns)
+
+    def rotate(self, image_path: str, turns: int = 1) -> None:
+        self.update(image_path, lambda current: current + turns)
+
+    def get_orientation(self, image_path: str) -> Orientation:
+        turns, mirror = get_exif_orientation(image_path)
+        return (turns + self.get_turns(image_path)) % 4, mirror
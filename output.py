@@ -0,0 +1,95 @@
+import os
+from typing import List, Tuple
+
+import cv2
+import numpy as np
+from cv2.typing import MatLike
+
+from orientation import Orientation, match_orientation
+
+PNG_COMPRESSION = 1
+PNG_STRATEGY = cv2.IMWRITE_PNG_STRATEGY_DEFAULT
+
+PNG_PARAMS = [cv2.IMWRITE_PNG_COMPRESSION, PNG_COMPRESSION, cv2.IMWRITE_PNG_STRATEGY, PNG_STRATEGY]
+PNG_RLE_PARAMS = [cv2.IMWRITE_PNG_COMPRESSION, PNG_COMPRESSION, cv2.IMWRITE_PNG_STRATEGY, cv2.IMWRITE_PNG_STRATEGY_RLE]
+
+OUTPUT_FORMAT_LIST = {
+    "png": (".png", PNG_PARAMS),
+    "png-rle": (".png", PNG_RLE_PARAMS),
+    "webp": (".webp", [cv2.IMWRITE_WEBP_QUALITY, 101]),
+    "mask": (".mask.png", PNG_RLE_PARAMS),
+    "mask-1bit": (".mask.png", [cv2.IMWRITE_PNG_COMPRESSION, PNG_COMPRESSION, cv2.IMWRITE_PNG_BILEVEL, 1]),
+}
+
+OUTPUT_SUFFIX_LIST = [".mask.png", ".webp", ".png"]
+
+MASK_SUFFIX = ".mask.png"
+
+
+def get_output_name(filename: str) -> str | None:
+    for suffix in OUTPUT_SUFFIX_LIST:
+        if filename.lower().endswith(suffix):
+            return filename[: -len(suffix)]
+    return None
+
+
+def get_output_paths(output_dir: str, image_name: str) -> List[str]:
+    return [os.path.join(output_dir, f"{image_name}{suffix}") for suffix in OUTPUT_SUFFIX_LIST]
+
+
+def find_output(output_dir: str, image_name: str) -> str | None:
+    for path in get_output_paths(output_dir, image_name):
+        if os.path.exists(path):
+            return path
+    return None
+
+
+def is_mask_of(cv_image: MatLike, cv_image_base: MatLike) -> bool:
+    if cv_image.shape != cv_image_base.shape:
+        return False
+    # What compose_mask rebuilds: colours of the original where visible, with alpha no higher than the original's.
+    keep = cv_image[:, :, 3] > 0
+    if not np.array_equal(cv_image[keep][:, :3], cv_image_base[keep][:, :3]):
+        return False
+    return bool(np.all(cv_image[:, :, 3] <= cv_image_base[:, :, 3]))
+
+
+def encode_output(cv_image: MatLike, cv_image_base: MatLike, output_format: str) -> Tuple[str, bool, MatLike]:
+    suffix, params = OUTPUT_FORMAT_LIST[output_format]
+    if suffix == MASK_SUFFIX:
+        # A mask can only be stored when every visible pixel still comes from the original.
+        if not is_mask_of(cv_image, cv_image_base):
+            return encode_output(cv_image, cv_image_base, "png")
+        alpha = cv_image[:, :, 3]
+        if output_format == "mask-1bit":
+            alpha = np.where(alpha > 0, 255, 0).astype(np.uint8)
+        result, n = cv2.imencode(".png", alpha, params)
+        return suffix, result, n
+    result, n = cv2.imencode(suffix, cv_image, params)
+    return suffix, result, n
+
+
+def compose_mask(mask: MatLike, cv_image_base: MatLike) -> MatLike:
+    if mask.shape[:2] != cv_image_base.shape[:2]:
+        raise ValueError("Mask size does not match the original image")
+    cv_image = np.zeros_like(cv_image_base)
+    keep = mask > 0
+    cv_image[keep] = cv_image_base[keep]
+    cv_image[:, :, 3] = np.minimum(cv_image[:, :, 3], mask)
+    return cv_image
+
+
+def decode_output(path: str, cv_image_base: MatLike, orientation: Orientation | None = None) -> MatLike:
+    value = cv2.imdecode(np.fromfile(path, np.uint8), cv2.IMREAD_UNCHANGED)
+    if orientation is not None:
+        matched = match_orientation(value, cv_image_base, orientation)
+        if matched is None:
+            raise ValueError("Result size does not match the original image")
+        value = matched
+    if path.lower().endswith(MASK_SUFFIX):
+        return compose_mask(value, cv_image_base)
+    if value.shape[:2] != cv_image_base.shape[:2]:
+        raise ValueError("Result size does not match the original image")
+    if value.shape[2] == 3:
+        value = cv2.cvtColor(value, cv2.COLOR_BGR2BGRA)
+    return value
@@ -0,0 +1,126 @@
+import json
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from tkinter import filedialog
+from typing import Dict, List, Sequence, Tuple
+
+import cv2
+import numpy as np
+from PIL import Image
+from tqdm import tqdm
+
+from scan import IMAGE_EXTENSIONS, scan_files
+
+PHASH_INDEX = ".phash.json"
+PHASH_DISTANCE = 6
+PHASH_WORKERS = 8
+# Bumped when hashes change meaning; entries from another version are recomputed.
+PHASH_VERSION = 2
+
+
+def get_phash(image_path: str) -> Tuple[List[int], Tuple[int, int]]:
+    """Hashes and size are both in the file's raw orientation; callers add EXIF and manual turns themselves."""
+    with Image.open(image_path) as image:
+        size = image.size
+    flag = cv2.IMREAD_REDUCED_GRAYSCALE_4 | cv2.IMREAD_IGNORE_ORIENTATION
+    value = cv2.imdecode(np.fromfile(image_path, np.uint8), flag)
+    small = cv2.resize(value, (32, 32), interpolation=cv2.INTER_AREA).astype(np.float32)
+    hashes = []
+    # One hash per counter-clockwise rotation, so rotated re-exports still match.
+    for k in range(4):
+        dct = cv2.dct(np.ascontiguousarray(np.rot90(small, k)))[:8, :8].flatten()
+        bits = dct > np.median(dct[1:])
+        hashes.append(int(np.packbits(bits).view(">u8")[0]))
+    return hashes, size
+
+
+class PHashIndex:
+    def __init__(self, folder_path: str) -> None:
+        self.folder_path = folder_path
+        self.path = os.path.join(folder_path, PHASH_INDEX)
+        self.entries: Dict[str, list] = {}
+        if os.path.exists(self.path):
+            with open(self.path, "r", encoding="utf-8") as f:
+                self.entries = json.load(f)
+        self.names: List[str] = []
+        self.hashes = np.zeros((0, 4), np.uint64)
+
+    def update(self, image_files: Sequence[str]) -> None:
+        # Keyed by path relative to the folder, which is the plain filename unless the images span subfolders.
+        stats = {os.path.relpath(path, self.folder_path): (path, os.stat(path)) for path in image_files}
+        changed = [
+            (name, path)
+            for name, (path, stat) in stats.items()
+            if self.entries.get(name, [None, None])[:2] != [stat.st_mtime_ns, stat.st_size]
+            or self.entries[name][4:] != [PHASH_VERSION]
+        ]
+        with ThreadPoolExecutor(max_workers=PHASH_WORKERS) as executor:
+            results = executor.map(lambda item: get_phash(item[1]), changed)
+            for (name, path), (hashes, size) in tqdm(zip(changed, results), total=len(changed)):
+                stat = stats[name][1]
+                self.entries[name] = [
+                    stat.st_mtime_ns,
+                    stat.st_size,
+                    [f"{h:016x}" for h in hashes],
+                    list(size),
+                    PHASH_VERSION,
+                ]
+        self.entries = {name: self.entries[name] for name in stats}
+
+        with open(f"{self.path}.tmp", "w", encoding="utf-8") as f:
+            json.dump(self.entries, f)
+        os.replace(f"{self.path}.tmp", self.path)
+
+        self.names = list(self.entries)
+        self.hashes = np.array([[int(h, 16) for h in self.entries[n][2]] for n in self.names], np.uint64).reshape(-1, 4)
+
+    def get_size(self, name: str) -> Tuple[int, int]:
+        return tuple(self.entries[name][3])  # type: ignore
+
+    def find_duplicates(self, name: str) -> List[Tuple[str, int]]:
+        """Returns near-duplicates of `name` with the number of clockwise quarter turns that maps it onto each."""
+        if name not in self.entries:
+            return []
+        index = self.names.index(name)
+        distance = np.bitwise_count(self.hashes[index, 0] ^ self.hashes)
+        rotation = distance.argmin(axis=1)
+        best = distance.min(axis=1)
+        matches = [i for i in np.argsort(best, kind="stable") if best[i] <= PHASH_DISTANCE and i != index]
+        return [(self.names[i], int(rotation[i])) for i in matches]
+
+    def get_groups(self) -> List[List[str]]:
+        parent = list(range(len(self.names)))
+
+        def find(i: int) -> int:
+            while parent[i] != i:
+                parent[i] = parent[parent[i]]
+                i = parent[i]
+            return i
+
+        for i in range(len(self.names)):
+            distance = np.bitwise_count(self.hashes[i, 0] ^ self.hashes[i + 1 :]).min(axis=1)
+            for j in np.nonzero(distance <= PHASH_DISTANCE)[0]:
+                parent[find(i + 1 + int(j))] = find(i)
+
+        groups: Dict[int, List[str]] = {}
+        for i, name in enumerate(self.names):
+            groups.setdefault(find(i), []).append(name)
+        return [group for group in groups.values() if len(group) > 1]
+
+
+def is_aligned(size: Tuple[int, int], target_size: Tuple[int, int], rotation: int) -> bool:
+    w, h = size if rotation % 2 == 0 else size[::-1]
+    return abs(w / h - target_size[0] / target_size[1]) < 0.01
+
+
+if __name__ == "__main__":
+    folder_path = sys.argv[1] if len(sys.argv) > 1 else filedialog.askdirectory(title="Select a folder")
+    if not folder_path:
+        raise SystemExit("No folder selected")
+
+    image_files = [os.path.join(d, name) for d, name in scan_files(folder_path, IMAGE_EXTENSIONS)]
+    phash_index = PHashIndex(folder_path)
+    phash_index.update(image_files)
+    for group in phash_index.get_groups():
+        print(f"near-duplicates: {', '.join(group)}")
@@ -0,0 +1,96 @@
+import os
+import threading
+from array import array
+from typing import Dict, Iterator, List, Sequence, Tuple, overload
+
+from alpha import ALPHA_DIR
+from export import EXPORT_DIR
+
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg")
+SCAN_SKIP_DIRS = ["include", "exclude", ALPHA_DIR, EXPORT_DIR]
+
+
+def scan_files(folder_path: str, extensions: Tuple[str, ...], recursive: bool = False) -> Iterator[Tuple[str, str]]:
+    """Yields (directory, filename) as `os.scandir` finds them; the file type comes from the entry, not a stat."""
+    stack = [folder_path]
+    while stack:
+        dir_path = stack.pop()
+        try:
+            it = os.scandir(dir_path)
+        except OSError:
+            continue
+        subdirs = []
+        with it:
+            for entry in it:
+                try:
+                    if entry.is_file():
+                        if entry.name.lower().endswith(extensions):
+                            yield dir_path, entry.name
+                    elif recursive and entry.is_dir(follow_symlinks=False):
+                        if not entry.name.startswith(".") and entry.name not in SCAN_SKIP_DIRS:
+                            subdirs.append(entry.path)
+                except OSError:
+                    continue
+        stack.extend(reversed(subdirs))
+
+
+class ImageList(Sequence[str]):
+    """Append-only list of image paths filled by a background scan.
+
+    Names are packed into one buffer with an offset array and a directory index, so a few hundred thousand
+    entries cost their filename bytes plus a dozen bytes each instead of one absolute path string per file.
+    """
+
+    def __init__(self) -> None:
+        self.dirs: List[str] = []
+        self.dir_ids: Dict[str, int] = {}
+        self.names = bytearray()
+        self.offsets = array("Q", [0])
+        self.dir_index = array("I")
+        self.found = threading.Event()
+        self.done = threading.Event()
+
+    def append(self, dir_path: str, name: str) -> None:
+        if dir_path not in self.dir_ids:
+            self.dir_ids[dir_path] = len(self.dirs)
+            self.dirs.append(dir_path)
+        self.names.extend(name.encode("utf-8", "surrogateescape"))
+        self.dir_index.append(self.dir_ids[dir_path])
+        # Appended last: an entry becomes visible to readers only once its name and directory are in place.
+        self.offsets.append(len(self.names))
+        self.found.set()
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    @overload
+    def __getitem__(self, index: int) -> str: ...
+
+    @overload
+    def __getitem__(self, index: slice) -> List[str]: ...
+
+    def __getitem__(self, index: int | slice) -> str | List[str]:
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError(index)
+        name = self.names[self.offsets[index] : self.offsets[index + 1]].decode("utf-8", "surrogateescape")
+        return os.path.join(self.dirs[self.dir_index[index]], name)
+
+    def scan(self, folder_paths: List[str], recursive: bool = False) -> None:
+        def run() -> None:
+            try:
+                for folder_path in folder_paths:
+                    for dir_path, name in scan_files(folder_path, IMAGE_EXTENSIONS, recursive):
+                        self.append(dir_path, name)
+            finally:
+                self.done.set()
+                self.found.set()
+
+        threading.Thread(target=run, daemon=True).start()
+
+    def wait(self) -> None:
+        """Blocks until the first image is found or the scan finished without any."""
+        self.found.wait()
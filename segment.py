@@ -0,0 +1,70 @@
+from typing import List, Tuple
+
+import cv2
+import numpy as np
+from cv2.typing import MatLike
+from skimage.color import rgb2gray
+from skimage.filters import sobel
+from skimage.segmentation import felzenszwalb, slic, watershed
+
+SEGMENT_METHOD = "slic"
+SEGMENT_COUNT = 2000
+SEGMENT_MAX_SIZE = 1024
+
+
+def get_labels(image: MatLike, method: str = SEGMENT_METHOD) -> Tuple[MatLike, MatLike]:
+    """Returns the labels at full resolution and at the reduced size they were computed at."""
+    h, w = image.shape[:2]
+    scale = min(SEGMENT_MAX_SIZE / max(h, w), 1)
+    small = cv2.resize(image, (max(int(w * scale), 1), max(int(h * scale), 1)), interpolation=cv2.INTER_AREA)
+    small = cv2.cvtColor(small, cv2.COLOR_BGRA2RGB)
+    if method == "slic":
+        labels = slic(small, n_segments=SEGMENT_COUNT, compactness=10, start_label=0)
+    elif method == "felzenszwalb":
+        labels = felzenszwalb(small, scale=100, sigma=0.5, min_size=20)
+    elif method == "watershed":
+        labels = watershed(sobel(rgb2gray(small)), markers=SEGMENT_COUNT, compactness=0.001) - 1
+    else:
+        raise ValueError(f"Unknown segment method: {method}")
+    labels = labels.astype(np.int32)
+    rows = np.arange(h) * labels.shape[0] // h
+    cols = np.arange(w) * labels.shape[1] // w
+    return labels[rows[:, None], cols[None, :]], labels
+
+
+class Segmentation:
+    def __init__(self, image: MatLike, method: str = SEGMENT_METHOD) -> None:
+        self.labels, small = get_labels(image, method)
+        flat = self.labels.ravel()
+        count = int(flat.max()) + 1
+        sizes = np.bincount(flat, minlength=count)
+        colors = [np.bincount(flat, weights=image[:, :, c].ravel(), minlength=count) for c in range(3)]
+        self.colors = np.stack(colors, axis=1) / np.maximum(sizes, 1)[:, None]
+
+        # Pixel indices grouped by region, so a region can be applied in time proportional to its size.
+        self.order = np.argsort(flat, kind="stable").astype(np.int32)
+        self.starts = np.concatenate([[0], np.cumsum(sizes)])
+
+        # Nearest-neighbour upsampling adds no adjacencies, so the reduced map is enough and much smaller.
+        pairs = np.concatenate(
+            [
+                np.stack([small[:, :-1].ravel(), small[:, 1:].ravel()], axis=1),
+                np.stack([small[:-1, :].ravel(), small[1:, :].ravel()], axis=1),
+            ]
+        ).astype(np.int64)
+        pairs = pairs[pairs[:, 0] != pairs[:, 1]]
+        keys = np.unique(np.concatenate([pairs[:, 0] * count + pairs[:, 1], pairs[:, 1] * count + pairs[:, 0]]))
+        self.neighbor_region = (keys % count).astype(np.int32)
+        self.neighbor_starts = np.searchsorted(keys // count, np.arange(count + 1))
+
+    def select(self, pos: Tuple[int, int], threshold: float) -> MatLike:
+        seed = int(self.labels[pos[1], pos[0]])
+        similar = np.all(np.abs(self.colors - self.colors[seed]) <= threshold, axis=1)
+        selected: List[int] = [seed]
+        visited = {seed}
+        for region in selected:
+            for neighbor in self.neighbor_region[self.neighbor_starts[region] : self.neighbor_starts[region + 1]]:
+                if similar[neighbor] and neighbor not in visited:
+                    visited.add(int(neighbor))
+                    selected.append(int(neighbor))
+        return np.concatenate([self.order[self.starts[r] : self.starts[r + 1]] for r in selected])
@@ -0,0 +1,187 @@
+import io
+import os
+import queue
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List
+from urllib.parse import parse_qs, urlparse
+
+import numpy as np
+from cv2.typing import MatLike
+
+SERVER_HOST = "127.0.0.1"
+SERVER_PORT = 8765
+SERVER_RETRY = 5.0
+# A server still downloading or building a model, or stuck, must not freeze the viewer; callers then run locally.
+SERVER_TIMEOUT = 30.0
+BATCH_WINDOW = 0.01
+BATCH_SIZE = 8
+
+
+class BatchSession:
+    """Stands in for a rembg session's `inner_session` and runs concurrent single-image calls as one batch."""
+
+    def __init__(self, inner_session: Any) -> None:
+        self.inner_session = inner_session
+        batch = inner_session.get_inputs()[0].shape[0]
+        self.batchable = not isinstance(batch, int) or batch != 1
+        self.queue: queue.Queue[Dict[str, Any]] = queue.Queue()
+        self.thread = threading.Thread(target=self.batch_loop, daemon=True)
+        self.thread.start()
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self.inner_session, name)
+
+    def run(self, output_names: List[str] | None, input_feed: Dict[str, np.ndarray], *args: Any) -> List[np.ndarray]:
+        request = {"output_names": output_names, "input_feed": input_feed, "event": threading.Event()}
+        self.queue.put(request)
+        request["event"].wait()
+        if "error" in request:
+            raise request["error"]
+        return request["result"]
+
+    def batch_loop(self) -> None:
+        while True:
+            requests = [self.queue.get()]
+            deadline = time.monotonic() + BATCH_WINDOW
+            while self.batchable and len(requests) < BATCH_SIZE:
+                try:
+                    requests.append(self.queue.get(timeout=max(deadline - time.monotonic(), 0)))
+                except queue.Empty:
+                    break
+
+            groups: Dict[tuple, List[Dict[str, Any]]] = {}
+            for request in requests:
+                feed = request["input_feed"]
+                key = (str(request["output_names"]), tuple((k, v.shape) for k, v in sorted(feed.items())))
+                groups.setdefault(key, []).append(request)
+            for group in groups.values():
+                self.run_batch(group)
+
+    def run_batch(self, requests: List[Dict[str, Any]]) -> None:
+        try:
+            if len(requests) == 1:
+                request = requests[0]
+                request["result"] = self.inner_session.run(request["output_names"], request["input_feed"])
+            else:
+                feed = {k: np.concatenate([r["input_feed"][k] for r in requests]) for k in requests[0]["input_feed"]}
+                outputs = self.inner_session.run(requests[0]["output_names"], feed)
+                for i, request in enumerate(requests):
+                    request["result"] = [output[i : i + 1] for output in outputs]
+        except Exception as e:
+            for request in requests:
+                request["error"] = e
+        for request in requests:
+            request["event"].set()
+
+
+class InferenceServer(ThreadingHTTPServer):
+    def __init__(
+        self,
+        model_names: List[str],
+        providers: List[str],
+        calibration_files: List[str] | None = None,
+        host: str = SERVER_HOST,
+        port: int = SERVER_PORT,
+    ):
+        super().__init__((host, port), InferenceHandler)
+        self.model_names = model_names
+        self.providers = providers
+        self.calibration_files = calibration_files
+        self.sessions: Dict[str, Any] = {}
+        self.lock = threading.Lock()
+
+    def get_session(self, model_name: str) -> Any:
+        from variant import new_model_session
+
+        with self.lock:
+            if model_name not in self.sessions:
+                session = new_model_session(model_name, self.providers, self.calibration_files)
+                if hasattr(session, "inner_session"):
+                    session.inner_session = BatchSession(session.inner_session)
+                self.sessions[model_name] = session
+            return self.sessions[model_name]
+
+
+class InferenceHandler(BaseHTTPRequestHandler):
+    server: InferenceServer
+
+    def do_POST(self) -> None:
+        from rembg import remove
+
+        url = urlparse(self.path)
+        model_name = parse_qs(url.query).get("model", [""])[0]
+        if url.path != "/remove" or model_name not in self.server.model_names:
+            self.send_error(404)
+            return
+        body = self.rfile.read(int(self.headers["Content-Length"]))
+        value = np.load(io.BytesIO(body), allow_pickle=False)
+        try:
+            session = self.server.get_session(model_name)
+        except ValueError as e:
+            # e.g. an uncached @int8-static variant without calibration images; the client reports this.
+            message = str(e).encode("utf-8")
+            self.send_response(400)
+            self.send_header("Content-Type", "text/plain; charset=utf-8")
+            self.send_header("Content-Length", str(len(message)))
+            self.end_headers()
+            self.wfile.write(message)
+            return
+        alpha_map = remove(value, session=session, only_mask=True)
+
+        output = io.BytesIO()
+        np.save(output, np.asarray(alpha_map), allow_pickle=False)
+        self.send_response(200)
+        self.send_header("Content-Type", "application/octet-stream")
+        self.send_header("Content-Length", str(output.getbuffer().nbytes))
+        self.end_headers()
+        self.wfile.write(output.getvalue())
+
+    def log_message(self, format: str, *args: Any) -> None:
+        pass
+
+
+class InferenceClient:
+    """Sends images to a running `server.py`; returns None when it is not reachable or does not answer within
+    `timeout` seconds so callers can run locally.
+    A request the server rejects raises ValueError instead, since running locally would not be what was asked."""
+
+    def __init__(self, host: str = SERVER_HOST, port: int = SERVER_PORT, timeout: float = SERVER_TIMEOUT) -> None:
+        self.url = f"http://{host}:{port}/remove"
+        self.timeout = timeout
+        self.retry_at = 0.0
+
+    def remove(self, value: MatLike, model_name: str) -> MatLike | None:
+        if time.monotonic() < self.retry_at:
+            return None
+        body = io.BytesIO()
+        np.save(body, np.ascontiguousarray(value), allow_pickle=False)
+        request = urllib.request.Request(f"{self.url}?model={model_name}", data=body.getvalue(), method="POST")
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                return np.load(io.BytesIO(response.read()), allow_pickle=False)
+        except urllib.error.HTTPError as e:
+            message = e.read().decode("utf-8", "replace")
+            raise ValueError(f"Inference server rejected {model_name}: {e.code} {message}") from e
+        except (urllib.error.URLError, ConnectionError, TimeoutError):
+            self.retry_at = time.monotonic() + SERVER_RETRY
+            return None
+
+
+if __name__ == "__main__":
+    from main import MODEL_NAME_LIST, PROVIDERS_LIST
+    from scan import IMAGE_EXTENSIONS, scan_files
+    from variant import get_model_name_list
+
+    port = int(sys.argv[1]) if len(sys.argv) > 1 else SERVER_PORT
+    # Images to calibrate @int8-static variants that are not cached yet.
+    calibration_files = (
+        [os.path.join(d, f) for d, f in scan_files(sys.argv[2], IMAGE_EXTENSIONS)] if len(sys.argv) > 2 else None
+    )
+    server = InferenceServer(get_model_name_list(MODEL_NAME_LIST), PROVIDERS_LIST, calibration_files, port=port)
+    print(f"Listening on http://{SERVER_HOST}:{port}")
+    server.serve_forever()
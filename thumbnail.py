@@ -0,0 +1,273 @@
+import hashlib
+import json
+import os
+import tkinter as tk
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Dict, Sequence, Set, Tuple
+
+import cv2
+import numpy as np
+from cv2.typing import MatLike
+from PIL import Image, ImageTk
+
+from orientation import Orientation, OrientationManifest, apply_orientation, match_orientation
+from output import MASK_SUFFIX, OUTPUT_SUFFIX_LIST, get_output_name
+
+THUMBNAIL_DIR = os.path.join(os.path.expanduser("~"), ".cache", "background_erase", "thumbnail")
+THUMBNAIL_SIZE = 128
+THUMBNAIL_WORKERS = 8
+THUMBNAIL_MEMORY = 512
+THUMBNAIL_PADDING = 6
+
+STATUS_COLOR_LIST = {
+    "include": "#33cc33",
+    "exclude": "#cc3333",
+    "none": "#666666",
+}
+
+STATUS_FILTER_LIST = ["all", *STATUS_COLOR_LIST]
+
+
+def list_outputs(folder_path: str) -> Dict[str, Tuple[str, str]]:
+    """Maps image paths without extension to (status, output path) with one listdir per output folder."""
+    outputs: Dict[str, Tuple[str, str]] = {}
+    for status in ["exclude", "include"]:
+        output_dir = os.path.join(folder_path, status)
+        if not os.path.isdir(output_dir):
+            continue
+        found: Dict[str, Tuple[int, str]] = {}
+        for filename in os.listdir(output_dir):
+            image_name = get_output_name(filename)
+            if image_name is None:
+                continue
+            # Same precedence as find_output when several formats are left over.
+            rank = [filename.lower().endswith(suffix) for suffix in OUTPUT_SUFFIX_LIST].index(True)
+            if image_name not in found or rank < found[image_name][0]:
+                found[image_name] = (rank, filename)
+        for image_name, (_, filename) in found.items():
+            outputs[os.path.join(folder_path, image_name)] = (status, os.path.join(output_dir, filename))
+    return outputs
+
+
+def get_thumbnail_path(image_path: str, output_path: str | None, orientation: Orientation) -> str:
+    key: list = [os.path.abspath(image_path), os.stat(image_path).st_mtime_ns, list(orientation)]
+    if output_path is not None:
+        key += [os.path.abspath(output_path), os.stat(output_path).st_mtime_ns]
+    name = hashlib.sha1(json.dumps(key).encode("utf-8")).hexdigest()
+    return os.path.join(THUMBNAIL_DIR, name[:2], f"{name}.jpg")
+
+
+def fit_thumbnail(value: MatLike) -> MatLike:
+    h, w = value.shape[:2]
+    scale = THUMBNAIL_SIZE / max(h, w)
+    size = (max(int(w * scale), 1), max(int(h * scale), 1))
+    return cv2.resize(value, size, interpolation=cv2.INTER_AREA)
+
+
+def make_thumbnail(image_path: str, output_path: str | None, orientation: Orientation) -> MatLike:
+    """Original and result side by side, the result composited over a checkerboard."""
+    flag = cv2.IMREAD_COLOR | cv2.IMREAD_IGNORE_ORIENTATION
+    if image_path.lower().endswith((".jpg", ".jpeg")):
+        flag = cv2.IMREAD_REDUCED_COLOR_4 | cv2.IMREAD_IGNORE_ORIENTATION
+    base = fit_thumbnail(apply_orientation(cv2.imdecode(np.fromfile(image_path, np.uint8), flag), orientation))
+
+    tile = np.full((THUMBNAIL_SIZE, THUMBNAIL_SIZE * 2, 3), 30, np.uint8)
+    h, w = base.shape[:2]
+    y, x = (THUMBNAIL_SIZE - h) // 2, (THUMBNAIL_SIZE - w) // 2
+    tile[y : y + h, x : x + w] = base
+    if output_path is None:
+        return tile
+
+    value = match_orientation(cv2.imdecode(np.fromfile(output_path, np.uint8), cv2.IMREAD_UNCHANGED), base, orientation)
+    if value is None:
+        return tile
+    if output_path.lower().endswith(MASK_SUFFIX):
+        rgb = base
+        alpha = cv2.resize(value, (w, h), interpolation=cv2.INTER_AREA)
+    else:
+        value = fit_thumbnail(value)
+        rgb = value[:, :, :3]
+        alpha = value[:, :, 3] if value.shape[2] == 4 else np.full(value.shape[:2], 255, np.uint8)
+    h, w = rgb.shape[:2]
+    checker = (np.add.outer(np.arange(h) // 8, np.arange(w) // 8) % 2 * 60 + 100).astype(np.float32)
+    a = alpha.astype(np.float32)[:, :, None] / 255
+    composite = (rgb * a + checker[:, :, None] * (1 - a)).astype(np.uint8)
+    y, x = (THUMBNAIL_SIZE - h) // 2, THUMBNAIL_SIZE + (THUMBNAIL_SIZE - w) // 2
+    tile[y : y + h, x : x + w] = composite
+    return tile
+
+
+def get_thumbnail(image_path: str, output_path: str | None, orientation: Orientation) -> MatLike:
+    path = get_thumbnail_path(image_path, output_path, orientation)
+    if os.path.exists(path):
+        value = cv2.imdecode(np.fromfile(path, np.uint8), cv2.IMREAD_COLOR)
+        if value is not None:
+            return value
+    value = make_thumbnail(image_path, output_path, orientation)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    result, n = cv2.imencode(".jpg", value, [cv2.IMWRITE_JPEG_QUALITY, 85])
+    if result:
+        with open(f"{path}.tmp", "wb") as f:
+            f.write(n.tobytes())
+        os.replace(f"{path}.tmp", path)
+    return value
+
+
+class ThumbnailBrowser(tk.Toplevel):
+    """Grid of original/result pairs; only the visible rows are decoded and kept as Tk images."""
+
+    def __init__(
+        self,
+        master: tk.Misc,
+        image_files: Sequence[str],
+        orientation_manifest: OrientationManifest,
+        on_select: Callable[[int], None],
+    ) -> None:
+        super().__init__(master)
+        self.title("Browser")
+        self.geometry(f"{(THUMBNAIL_SIZE * 2 + THUMBNAIL_PADDING) * 4 + 40}x800")
+        self.image_files = image_files
+        self.orientation_manifest = orientation_manifest
+        self.on_select = on_select
+        self.executor = ThreadPoolExecutor(max_workers=THUMBNAIL_WORKERS)
+        self.futures: Dict[int, Future[MatLike]] = {}
+        self.photos: Dict[int, ImageTk.PhotoImage] = {}
+        self.failed: Set[int] = set()
+        self.current = -1
+
+        self.top_frame = tk.Frame(self)
+        self.top_frame.pack(side=tk.TOP, fill=tk.X)
+        self.filter_var = tk.StringVar()
+        self.filter_var.set(STATUS_FILTER_LIST[0])
+        self.filter_select = tk.OptionMenu(
+            self.top_frame,
+            self.filter_var,
+            *STATUS_FILTER_LIST,
+            command=lambda _: self.refresh(),
+        )
+        self.filter_select.config(width=8, indicatoron=False)
+        self.filter_select.pack(side=tk.LEFT, padx=5, pady=5)
+        self.refresh_button = tk.Button(self.top_frame, text="Refresh", command=lambda: self.refresh())
+        self.refresh_button.pack(side=tk.LEFT, padx=5, pady=5)
+        self.count_label = tk.Label(self.top_frame, text="")
+        self.count_label.pack(side=tk.LEFT, padx=5, pady=5)
+
+        self.canvas = tk.Canvas(self, bg="#1e1e1e", highlightthickness=0)
+        self.scrollbar = tk.Scrollbar(self, orient=tk.VERTICAL, command=self.scroll)
+        self.canvas.config(yscrollcommand=self.scrollbar.set)
+        self.scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        self.canvas.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+        self.canvas.bind("<Configure>", lambda _: self.redraw())
+        self.canvas.bind("<MouseWheel>", lambda e: self.scroll("scroll", -e.delta // 120, "units"))
+        self.canvas.bind("<Button-4>", lambda _: self.scroll("scroll", -1, "units"))
+        self.canvas.bind("<Button-5>", lambda _: self.scroll("scroll", 1, "units"))
+        self.canvas.bind("<Button-1>", self.click)
+        self.protocol("WM_DELETE_WINDOW", self.close)
+
+        self.refresh()
+        self.poll()
+
+    def refresh(self) -> None:
+        self.outputs: Dict[str, Tuple[str, str]] = {}
+        for folder_path in {os.path.dirname(path) for path in self.image_files}:
+            self.outputs.update(list_outputs(folder_path))
+        status_filter = self.filter_var.get()
+        self.indexes = [
+            i for i, path in enumerate(self.image_files) if status_filter in ("all", self.get_status(path)[0])
+        ]
+        self.count_label.config(text=f"{len(self.indexes)}/{len(self.image_files)}")
+        for future in self.futures.values():
+            future.cancel()
+        self.futures = {}
+        self.photos = {}
+        self.failed = set()
+        self.canvas.yview_moveto(0)
+        self.redraw()
+
+    def get_status(self, image_path: str) -> Tuple[str, str | None]:
+        status, output_path = self.outputs.get(os.path.splitext(image_path)[0], ("none", None))
+        return status, output_path
+
+    def get_layout(self) -> Tuple[int, int, int]:
+        tile_w, tile_h = THUMBNAIL_SIZE * 2 + THUMBNAIL_PADDING, THUMBNAIL_SIZE + THUMBNAIL_PADDING + 16
+        return max(self.canvas.winfo_width() // tile_w, 1), tile_w, tile_h
+
+    def scroll(self, *args) -> None:
+        self.canvas.yview(*args)
+        self.redraw()
+
+    def redraw(self) -> None:
+        columns, tile_w, tile_h = self.get_layout()
+        rows = (len(self.indexes) + columns - 1) // columns
+        self.canvas.config(scrollregion=(0, 0, columns * tile_w, rows * tile_h))
+        top = int(self.canvas.canvasy(0))
+        first = max(top // tile_h, 0) * columns
+        last = min((top + self.canvas.winfo_height()) // tile_h + 1, rows) * columns
+
+        visible = set(self.indexes[first:last])
+        for index in [i for i in self.futures if i not in visible]:
+            self.futures.pop(index).cancel()
+        self.canvas.delete("tile")
+        for n, index in enumerate(self.indexes[first:last], first):
+            x, y = n % columns * tile_w, n // columns * tile_h
+            image_path = self.image_files[index]
+            status, output_path = self.get_status(image_path)
+            width = 4 if index == self.current else 2
+            self.canvas.create_rectangle(
+                x + 1,
+                y + 1,
+                x + tile_w - 2,
+                y + THUMBNAIL_SIZE + 4,
+                outline=STATUS_COLOR_LIST[status],
+                width=width,
+                tags="tile",
+            )
+            self.canvas.create_text(
+                x + 4,
+                y + THUMBNAIL_SIZE + 6,
+                text=f"{index + 1}: {os.path.basename(image_path)}",
+                anchor=tk.NW,
+                fill="#dddddd",
+                tags="tile",
+            )
+            if index in self.photos:
+                self.canvas.create_image(x + 3, y + 3, image=self.photos[index], anchor=tk.NW, tags="tile")
+            elif index not in self.futures and index not in self.failed:
+                orientation = self.orientation_manifest.get_orientation(image_path)
+                self.futures[index] = self.executor.submit(get_thumbnail, image_path, output_path, orientation)
+
+        # Keep memory bounded on large folders; off-screen tiles are cheap to reload from the disk cache.
+        if len(self.photos) > THUMBNAIL_MEMORY:
+            for index in [i for i in self.photos if i not in visible][: len(self.photos) - THUMBNAIL_MEMORY]:
+                self.photos.pop(index)
+
+    def poll(self) -> None:
+        done = [index for index, future in self.futures.items() if future.done()]
+        for index in done:
+            future = self.futures.pop(index)
+            if future.cancelled():
+                continue
+            if future.exception() is not None:
+                self.failed.add(index)
+                continue
+            value = cv2.cvtColor(future.result(), cv2.COLOR_BGR2RGB)
+            self.photos[index] = ImageTk.PhotoImage(Image.fromarray(value), master=self)
+        if done:
+            self.redraw()
+        self.poll_id = self.after(50, self.poll)
+
+    def click(self, event: tk.Event) -> None:
+        columns, tile_w, tile_h = self.get_layout()
+        column = int(self.canvas.canvasx(event.x)) // tile_w
+        n = int(self.canvas.canvasy(event.y)) // tile_h * columns + column
+        if column < columns and 0 <= n < len(self.indexes):
+            self.on_select(self.indexes[n])
+
+    def set_current(self, index: int) -> None:
+        self.current = index
+        self.redraw()
+
+    def close(self) -> None:
+        self.after_cancel(self.poll_id)
+        self.executor.shutdown(wait=False, cancel_futures=True)
+        self.destroy()
@@ -0,0 +1,207 @@
+import os
+import sys
+import time
+import uuid
+from typing import Any, Dict, List, Sequence, Tuple
+
+import cv2
+import numpy as np
+import onnxruntime as ort
+from cv2.typing import MatLike
+from rembg import new_session, remove
+from rembg.sessions import sessions_class
+from rembg.sessions.base import BaseSession
+from rembg.sessions.u2net import U2netSession
+from tqdm import tqdm
+
+VARIANT_DIR = "variant"
+VARIANT_SEPARATOR = "@"
+VARIANT_LIST = [
+    "opt",
+    "int8",
+    "int8-static",
+]
+VARIANT_EXCLUDE = ["sam"]
+CALIBRATION_COUNT = 32
+
+
+def get_model_name_list(model_names: List[str]) -> List[str]:
+    return model_names + [
+        f"{model_name}{VARIANT_SEPARATOR}{variant}"
+        for model_name in model_names
+        if model_name not in VARIANT_EXCLUDE
+        for variant in VARIANT_LIST
+    ]
+
+
+def get_session_class(model_name: str) -> type[BaseSession]:
+    for session_class in sessions_class:
+        if session_class.name() == model_name:
+            return session_class
+    return U2netSession
+
+
+def get_session_options(optimized: bool) -> ort.SessionOptions:
+    sess_opts = ort.SessionOptions()
+    if "OMP_NUM_THREADS" in os.environ:
+        sess_opts.inter_op_num_threads = int(os.environ["OMP_NUM_THREADS"])
+        sess_opts.intra_op_num_threads = int(os.environ["OMP_NUM_THREADS"])
+    if optimized:
+        # The cached graph already went through the optimizer, so loading it should not pay for that again.
+        sess_opts.graph_optimization_level = ort.GraphOptimizationLevel.ORT_DISABLE_ALL
+    return sess_opts
+
+
+def optimize_model(src: str, dst: str) -> None:
+    sess_opts = ort.SessionOptions()
+    # Extended rather than all: layout-specific rewrites would tie the cached file to this CPU.
+    sess_opts.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_EXTENDED
+    sess_opts.optimized_model_filepath = dst
+    ort.InferenceSession(src, sess_options=sess_opts, providers=["CPUExecutionProvider"])
+
+
+def get_calibration_feeds(model_name: str, calibration_files: Sequence[str]) -> List[Dict[str, np.ndarray]]:
+    session = new_session(model_name=model_name, providers=["CPUExecutionProvider"])
+    feeds: List[Dict[str, np.ndarray]] = []
+    run = session.inner_session.run
+
+    def record(output_names: Any, input_feed: Dict[str, np.ndarray], *args: Any) -> Any:
+        feeds.append(input_feed)
+        return run(output_names, input_feed, *args)
+
+    # Record what the session's own preprocessing feeds to the graph instead of re-implementing it per model.
+    session.inner_session.run = record
+    for path in tqdm(calibration_files[:CALIBRATION_COUNT], desc="calibration"):
+        value = cv2.imdecode(np.fromfile(path, np.uint8), cv2.IMREAD_COLOR)
+        remove(cv2.cvtColor(value, cv2.COLOR_BGR2BGRA), session=session, only_mask=True)
+    return feeds
+
+
+def build_variant(model_name: str, variant: str, dst: str, calibration_files: Sequence[str] | None = None) -> None:
+    from onnxruntime.quantization import (
+        CalibrationDataReader,
+        QuantFormat,
+        QuantType,
+        quantize_dynamic,
+        quantize_static,
+    )
+
+    src = get_session_class(model_name).download_models()
+    os.makedirs(os.path.dirname(dst), exist_ok=True)
+    # Per-process names, since several workers or the server may build the same uncached variant at once.
+    tag = f"{os.getpid()}_{uuid.uuid4().hex[:8]}"
+    tmp, int8 = f"{dst}.{tag}.tmp.onnx", f"{dst}.{tag}.int8.onnx"
+
+    def is_built() -> bool:
+        return os.path.exists(dst) and os.path.getmtime(dst) >= os.path.getmtime(src)
+
+    try:
+        if variant == "opt":
+            optimize_model(src, tmp)
+        elif variant == "int8":
+            quantize_dynamic(src, int8, weight_type=QuantType.QUInt8)
+            optimize_model(int8, tmp)
+        elif variant == "int8-static":
+            if not calibration_files:
+                raise ValueError(f"{model_name}{VARIANT_SEPARATOR}{variant} needs calibration images")
+
+            class FeedReader(CalibrationDataReader):
+                def __init__(self, feeds: List[Dict[str, np.ndarray]]) -> None:
+                    self.feeds = iter(feeds)
+
+                def get_next(self) -> Dict[str, np.ndarray] | None:
+                    return next(self.feeds, None)
+
+            quantize_static(
+                src,
+                int8,
+                FeedReader(get_calibration_feeds(model_name, calibration_files)),
+                quant_format=QuantFormat.QDQ,
+                activation_type=QuantType.QUInt8,
+                weight_type=QuantType.QInt8,
+            )
+            optimize_model(int8, tmp)
+        else:
+            raise ValueError(f"Unknown model variant: {variant}")
+        if is_built():
+            return  # Another process finished first.
+        try:
+            os.replace(tmp, dst)
+        except OSError:
+            # e.g. Windows refuses to replace a model another process has open; theirs is just as good.
+            if not is_built():
+                raise
+    finally:
+        for path in (tmp, int8):
+            if os.path.exists(path):
+                os.remove(path)
+
+
+def get_variant_path(model_name: str, variant: str, calibration_files: Sequence[str] | None = None) -> str:
+    session_class = get_session_class(model_name)
+    dst = os.path.join(session_class.u2net_home(), VARIANT_DIR, f"{model_name}{VARIANT_SEPARATOR}{variant}.onnx")
+    src = session_class.download_models()
+    # Rebuild when rembg replaced the source model after the variant was cached.
+    if not os.path.exists(dst) or os.path.getmtime(dst) < os.path.getmtime(src):
+        build_variant(model_name, variant, dst, calibration_files)
+    return dst
+
+
+def new_model_session(
+    model_name: str,
+    providers: List[str],
+    calibration_files: Sequence[str] | None = None,
+) -> BaseSession:
+    """`new_session` that also accepts `<model>@<variant>` names from `get_model_name_list`."""
+    if VARIANT_SEPARATOR not in model_name:
+        return new_session(model_name=model_name, providers=providers)
+    base_name, variant = model_name.split(VARIANT_SEPARATOR, 1)
+    path = get_variant_path(base_name, variant, calibration_files)
+    session_class = get_session_class(base_name)
+    variant_class = type(session_class.__name__, (session_class,), {"download_models": classmethod(lambda cls: path)})
+    return variant_class(base_name, get_session_options(True), providers)
+
+
+def benchmark(model_name: str, images: List[MatLike], providers: List[str]) -> Tuple[float, float, List[MatLike]]:
+    start = time.perf_counter()
+    session = new_model_session(model_name, providers)
+    load_time = time.perf_counter() - start
+    start = time.perf_counter()
+    alpha_maps = [remove(image, session=session, only_mask=True) for image in images]
+    return load_time, (time.perf_counter() - start) / max(len(images), 1), alpha_maps  # type: ignore
+
+
+if __name__ == "__main__":
+    from alpha import ALPHA_THRESHOLD
+    from main import MODEL_NAME_LIST
+
+    if len(sys.argv) < 2:
+        raise SystemExit("Usage: python variant.py /path/to/images [model_name ...]")
+    folder_path = sys.argv[1]
+    model_names = sys.argv[2:] or [m for m in MODEL_NAME_LIST if m not in VARIANT_EXCLUDE]
+    calibration_files = [
+        os.path.join(folder_path, f)
+        for f in sorted(os.listdir(folder_path))
+        if f.lower().endswith((".png", ".jpg", ".jpeg"))
+    ]
+    images = [
+        cv2.cvtColor(cv2.imdecode(np.fromfile(path, np.uint8), cv2.IMREAD_COLOR), cv2.COLOR_BGR2BGRA)
+        for path in calibration_files[:CALIBRATION_COUNT]
+    ]
+
+    providers = ["CPUExecutionProvider"]
+    print(f"{'model':<36}{'load [s]':>10}{'infer [s]':>11}{'alpha diff':>12}{'mask IoU':>10}")
+    for model_name in model_names:
+        for variant in VARIANT_LIST:
+            get_variant_path(model_name, variant, calibration_files)
+        load_time, infer_time, references = benchmark(model_name, images, providers)
+        print(f"{model_name:<36}{load_time:>10.2f}{infer_time:>11.3f}{0:>12.4f}{1:>10.4f}")
+        for variant in VARIANT_LIST:
+            name = f"{model_name}{VARIANT_SEPARATOR}{variant}"
+            load_time, infer_time, alpha_maps = benchmark(name, images, providers)
+            diffs, ious = [], []
+            for reference, alpha_map in zip(references, alpha_maps):
+                diffs.append(np.abs(reference.astype(np.float32) - alpha_map.astype(np.float32)).mean() / 255)
+                a, b = reference >= ALPHA_THRESHOLD, alpha_map >= ALPHA_THRESHOLD
+                ious.append((a & b).sum() / max((a | b).sum(), 1))
+            print(f"{name:<36}{load_time:>10.2f}{infer_time:>11.3f}{np.mean(diffs):>12.4f}{np.mean(ious):>10.4f}")